@@ -0,0 +1,236 @@
+"""
+Measure how fast cribbage scores and plays
+
+Each case is timed in batches of calls for a few seconds, reporting
+operations per second and percentiles of the time per call. Results can
+be saved as JSON and compared against a saved baseline.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import typing
+
+import cribbage
+import logger
+
+baseline_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "bench_baseline.json"
+)
+
+
+logged_cases = {"game_2p_logged"}
+
+
+def import_seconds(module: str = "cribbage", repeat: int = 5) -> float:
+    """
+    Time importing `module` in fresh interpreters, from an empty directory
+    Return the fastest of `repeat` runs
+    """
+    code = f"import time; s = time.perf_counter(); import {module}; "
+    code += "print(time.perf_counter() - s)"
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    times = []
+    with tempfile.TemporaryDirectory() as directory:
+        for _ in range(repeat):
+            output = subprocess.run(
+                [sys.executable, "-c", code],
+                cwd=directory,
+                env=env,
+                capture_output=True,
+                check=True,
+                text=True,
+            ).stdout
+            times.append(float(output))
+    return min(times)
+
+
+def measure(func: typing.Callable[[], None], seconds: float = 1.0) -> dict:
+    """
+    Call `func` in batches for about `seconds`
+    Batches take about a millisecond, so fast calls aren't swamped by the timer
+    """
+    batch = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(batch):
+            func()
+        if time.perf_counter() - start > 0.001:
+            break
+        batch *= 2
+    per_call = []
+    calls = 0
+    elapsed = 0.0
+    while elapsed < seconds or len(per_call) < 5:
+        start = time.perf_counter()
+        for _ in range(batch):
+            func()
+        taken = time.perf_counter() - start
+        per_call.append(taken / batch)
+        calls += batch
+        elapsed += taken
+    cuts = statistics.quantiles(per_call, n=100)
+    return {
+        "ops_per_second": calls / elapsed,
+        "p50_us": cuts[49] * 1e6,
+        "p90_us": cuts[89] * 1e6,
+        "p99_us": cuts[98] * 1e6,
+    }
+
+
+def cycle(items: list) -> typing.Callable[[], typing.Any]:
+    """Return each of `items` in turn, forever"""
+    position = [0]
+
+    def next_item():
+        position[0] = (position[0] + 1) % len(items)
+        return items[position[0]]
+
+    return next_item
+
+
+def hand_cycle(rng) -> None:
+    """Deal, discard, cut, peg and count one hand between two players"""
+    players = [cribbage.Player("1"), cribbage.Player("2")]
+    deck = cribbage.build_deck()
+    rng.shuffle(deck)
+    hand = cribbage.Hand(players, deck, win=1 << 30, headless=True, rng=rng)
+    hand.deal()
+    hand.collect()
+    hand.cut()
+    hand.tricks()
+    hand.count()
+
+
+def cases() -> typing.Dict[str, typing.Callable[[], None]]:
+    """The operations to time, with their inputs built up front"""
+    rng = cribbage.game_rng("bench", 0)
+    deck = cribbage.build_deck()
+    hands = []
+    stacks = []
+    for _ in range(1000):
+        rng.shuffle(deck)
+        hands.append((deck[:4], deck[4]))
+        stack = []
+        for card in deck:
+            if sum(c.value for c in stack) + card.value <= 31:
+                stack.append(card)
+        stacks.append(stack[: rng.randint(1, len(stack))])
+    strings = [card.name for card in deck]
+    next_hand = cycle(hands)
+    next_stack = cycle(stacks)
+    next_string = cycle(strings)
+    games = {}
+    for n in (2, 3, 4):
+        games[f"game_{n}p"] = lambda n=n: cribbage.Game(
+            n=n, headless=True, rng=rng
+        ).play()
+    # logged to a file by `run`, to compare with headless games
+    games["game_2p_logged"] = lambda: cribbage.Game(n=2, rng=rng).play()
+    return {
+        "score": lambda: cribbage.score(*next_hand()),
+        "score_pegs": lambda: cribbage.score_pegs(next_stack()),
+        "card_from_string": lambda: cribbage.card_from_string(next_string()),
+        "canonical": lambda: cribbage.canonical(*next_hand()),
+        "build_deck": cribbage.build_deck,
+        "hand": lambda: hand_cycle(rng),
+        **games,
+    }
+
+
+def run(names: typing.List[str] = None, seconds: float = 1.0) -> dict:
+    """Time the cases in `names`, or all of them"""
+    logger.configure_logging(None)
+    cribbage.score_table()
+    cribbage.peg_table()
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        for name, func in cases().items():
+            if names and name not in names:
+                continue
+            if name in logged_cases:
+                logger.configure_logging(os.path.join(directory, "cribbage.log"))
+            results[name] = measure(func, seconds)
+            logger.configure_logging(None)
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float = 0.2) -> typing.List[str]:
+    """
+    Return the cases more than `threshold` slower than the baseline,
+    as a fraction of the baseline's operations per second
+    """
+    regressions = []
+    for name, result in results["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            continue
+        ratio = result["ops_per_second"] / base["ops_per_second"]
+        if ratio < 1 - threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark cribbage")
+    parser.add_argument("cases", nargs="*", help="cases to run (default all)")
+    parser.add_argument("--seconds", type=float, default=1.0, help="per case")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument(
+        "--save-baseline", action="store_true", help="replace the baseline"
+    )
+    args = parser.parse_args(argv)
+
+    print(f"import\t{import_seconds() * 1000:.1f} ms")
+    results = run(args.cases, args.seconds)
+    baseline = None
+    if not args.save_baseline and os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline, args.threshold) if baseline else []
+
+    print("case\tops/s\tp50 us\tp90 us\tp99 us\tbaseline")
+    for name, result in results["results"].items():
+        line = (
+            f"{name}\t{result['ops_per_second']:.1f}\t{result['p50_us']:.1f}"
+            f"\t{result['p90_us']:.1f}\t{result['p99_us']:.1f}"
+        )
+        if baseline and name in baseline["results"]:
+            base = baseline["results"][name]["ops_per_second"]
+            line += f"\t{result['ops_per_second'] / base:.2f}x"
+            if name in regressions:
+                line += " REGRESSION"
+        print(line)
+
+    timed = results["results"]
+    if "game_2p" in timed and "game_2p_logged" in timed:
+        speedup = timed["game_2p"]["ops_per_second"]
+        speedup /= timed["game_2p_logged"]["ops_per_second"]
+        print(f"headless 2 player games are {speedup:.1f}x as fast as logged")
+
+    for path in [args.output, args.baseline if args.save_baseline else None]:
+        if path:
+            with open(path, "w") as f:
+                json.dump(results, f, indent=2)
+                f.write("\n")
+    if regressions:
+        sys.exit(
+            f"{len(regressions)} case(s) over {args.threshold:.0%} slower "
+            f"than {args.baseline}: {', '.join(regressions)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,21 +2,29 @@
 Collection of objects to represent possible cribbage hands
 """
 
+import argparse
+import array
+import collections
+import concurrent.futures
+import contextlib
 import functools
+import importlib
+import logging
+import mmap
+import os
 import random
+import sys
+import tempfile
+import time
 import typing
 import uuid
 from itertools import combinations
+from itertools import combinations_with_replacement
 from itertools import permutations
 
 import logger
 
 faces = {
-    "10": {
-        "seq": 1,
-        "value": 1,
-        "letter": "1",
-    },
     "Jack": {
         "seq": 11,
         "value": 10,
@@ -55,88 +63,144 @@ suits = {
 }
 
 
+suit_names = ["Spade", "Heart", "Diamond", "Club"]
+
+rank_names = [
+    "Ace",
+    "2",
+    "3",
+    "4",
+    "5",
+    "6",
+    "7",
+    "8",
+    "9",
+    "10",
+    "Jack",
+    "Queen",
+    "King",
+]
+
+
 class Card:
+    """
+    A playing card
+
+    There is one shared instance of each of the 52 cards,
+    so build cards with `build_card` rather than calling Card.
+    `index` runs from 0 to 51, suit by suit, in the order of `build_deck`.
+    """
+
+    __slots__ = ("rank", "suit", "seq", "value", "name", "index")
+
     def __init__(self, rank: str, suit: str, seq: int, value: int):
         self.rank = rank
         self.suit = suit
         self.seq = seq
         self.value = value
         self.name = self.rank[0] + self.suit[0]
+        self.index = 13 * suit_names.index(suit) + seq - 1
 
     def __repr__(self):
         return self.name
 
+    def __reduce__(self):
+        # unpickle to the shared instance
+        return card_from_index, (self.index,)
+
+
+def rank_seq_value(rank: str) -> typing.Tuple[int, int]:
+    """Return the sequence and counting value of a rank"""
+    try:
+        seq = int(rank)
+        value = int(rank)
+    except ValueError:
+        seq = faces[rank]["seq"]
+        value = faces[rank]["value"]
+    return seq, value
+
+
+all_cards = tuple(
+    Card(rank, suit, *rank_seq_value(rank))
+    for suit in suit_names
+    for rank in rank_names
+)
+
+# card attributes by index, for code working with cards as ints
+card_seqs = tuple(card.seq for card in all_cards)
+card_values = tuple(card.value for card in all_cards)
+card_suits = tuple(suit_names.index(card.suit) for card in all_cards)
+
+
+def card_from_index(index: int) -> Card:
+    """Return the card for an index from 0 to 51"""
+    return all_cards[index]
+
 
 def build_deck() -> list:
     """
     Build a deck of standard playing cards
     Return a list of the 52 class objects
     """
-    deck = list()
-
-    suits = ["Spade", "Heart", "Diamond", "Club"]
-
-    ranks = [
-        "Ace",
-        "2",
-        "3",
-        "4",
-        "5",
-        "6",
-        "7",
-        "8",
-        "9",
-        "10",
-        "Jack",
-        "Queen",
-        "King",
-    ]
-
-    for suit in suits:
-        for rank in ranks:
-            card = build_card(rank, suit)
-            deck.append(card)
-    return deck
+    return list(all_cards)
 
 
 def build_card(rank: str, suit: str) -> Card:
     """Make a card from the rank and suit"""
-    try:
-        seq = int(rank)
-        value = int(rank)
-    except ValueError:
-        seq = faces[rank]["seq"]
-        value = faces[rank]["value"]
-    return Card(rank, suit, seq, value)
+    seq, value = rank_seq_value(rank)
+    return all_cards[13 * suit_names.index(suit) + seq - 1]
 
 
-def build_letter_function(letter):
-    def get_letter(pair) -> bool:
-        """function to filter a dict by the child key `letter`"""
-        key, value = pair
-        try:
-            if value["letter"] == letter:
-                return True
-        except:
-            return False
-
-    return get_letter
+# every way to write a card: its name, and "10" or "T" for the ten as well as "1"
+card_strings = {card.name: card for card in all_cards}
+card_strings.update(
+    {
+        rank + card.name[1]: card
+        for card in all_cards
+        if card.seq == 10
+        for rank in ("10", "T")
+    }
+)
+card_string_indices = {string: card.index for string, card in card_strings.items()}
 
 
 def card_from_string(card_string) -> Card:
-    """Make a card given the two letter abbreviation"""
-    rank_letter = card_string[0]
-    suit_letter = card_string[1]
-    rank_filter_function = build_letter_function(rank_letter)
-    suit_filter_function = build_letter_function(suit_letter)
-    suit_dict = dict(filter(suit_filter_function, suits.items()))
-    suit = list(suit_dict.keys())[0]
+    """Make a card given its abbreviation, like 5H, or 1D, 10D or TD for a ten"""
     try:
-        rank_dict = dict(filter(rank_filter_function, faces.items()))
-        rank = list(rank_dict.keys())[0]
-    except:
-        rank = rank_letter
-    return build_card(rank, suit)
+        return card_strings[card_string]
+    except KeyError:
+        raise ValueError(f"Unknown card {card_string!r}") from None
+
+
+def parse_hands(text, width: int = 5, first_line: int = 1) -> array.array:
+    """
+    Parse hands written one per line, like "5H 5S JD 5C 5D",
+    into a flat array of `width` card indices per hand
+
+    `text` is a str or bytes. A line without exactly `width` cards, blank
+    lines included, raises a ValueError naming the line, counted from
+    `first_line`. With NumPy, `numpy.frombuffer(indices, numpy.uint8)
+    .reshape(-1, 5)` gives the hands and cuts for `score_batch` as its
+    first four columns and its last.
+    """
+    if not isinstance(text, str):
+        text = bytes(text).decode("ascii")
+    lines = text.split("\n")
+    if lines[-1] == "":  # the break ending the last line
+        lines.pop()
+    lookup = card_string_indices.__getitem__
+    indices = array.array("B")
+    for number, line in enumerate(lines, first_line):
+        words = line.split()
+        if len(words) != width:
+            raise ValueError(
+                f"line {number}: expected {width} cards, found {len(words)}"
+            )
+        try:
+            indices.extend(map(lookup, words))
+        except KeyError as error:
+            raise ValueError(f"line {number}: unknown card {error.args[0]!r}") from None
+    return indices
 
 
 def build_hand() -> list:
@@ -188,14 +252,16 @@ def consecutive_cards(cards: typing.List[Card]) -> bool:
 def score_fifteen(cards: typing.List[Card]) -> int:
     """
     Score when a set of cards = 15
+
+    Counts the subsets adding up to each total from 0 to 15,
+    one card at a time, so any number of cards is cheap.
     """
-    points = 0
-    for count_cards in range(len(cards) + 1):
-        for subset in combinations(cards, count_cards):
-            if add_cards(subset) == 15:
-                logger.logger.debug(f"15 two! {subset}")
-                points += 2
-    return points
+    ways = [1] + [0] * 15
+    for card in cards:
+        value = card.value
+        for total in range(15, value - 1, -1):
+            ways[total] += ways[total - value]
+    return 2 * ways[15]
 
 
 def score_pair(cards: typing.List[Card]) -> int:
@@ -213,6 +279,9 @@ def score_pair(cards: typing.List[Card]) -> int:
 def score_seq(cards: typing.List[Card]) -> int:
     """
     Score when a the ranks of cards in a set are in sequence
+
+    Checks every permutation, so it is slow.
+    Kept as a reference for `score_runs`.
     """
     points = 0
     sequences = []
@@ -249,6 +318,31 @@ def score_seq(cards: typing.List[Card]) -> int:
     return points
 
 
+def score_runs(cards: typing.List[Card]) -> int:
+    """
+    Score runs from a histogram of ranks
+
+    Each run of three or more consecutive ranks scores its length
+    once for every way of picking one card from each rank in it.
+    """
+    counts = [0] * 15  # padded so every run is followed by an empty rank
+    for card in cards:
+        counts[card.seq] += 1
+    points = 0
+    length = 0
+    multiplicity = 1
+    for count in counts:
+        if count:
+            length += 1
+            multiplicity *= count
+            continue
+        if length >= 3:
+            points += length * multiplicity
+        length = 0
+        multiplicity = 1
+    return points
+
+
 def score_flush(hand: typing.List[Card], cut: Card) -> int:
     # check for a flush
     points = 0
@@ -276,9 +370,11 @@ def score_cut(hand: typing.List[Card], cut: Card) -> int:
     return 0
 
 
-def score(hand: typing.List[Card], cut: Card = None) -> int:
+def score_direct(hand: typing.List[Card], cut: Card = None) -> int:
     """
-    Count a cribbage hand
+    Count a cribbage hand by running every scoring rule
+
+    This is the reference implementation behind `score`
     """
     score = 0
     full_hand = hand
@@ -286,12 +382,574 @@ def score(hand: typing.List[Card], cut: Card = None) -> int:
         full_hand = hand + [cut]
     score += score_fifteen(full_hand)
     score += score_pair(full_hand)
-    score += score_seq(full_hand)
+    score += score_runs(full_hand)
     score += score_flush(hand, cut)
     score += score_cut(hand, cut)
     return score
 
 
+"""
+Lookup table for scoring hands
+
+Fifteens, pairs and runs only depend on the ranks in the hand plus the cut,
+so those points are precomputed once for every multiset of up to five ranks.
+Flushes and his nobs depend on suits and are added on top.
+
+A multiset of ranks is keyed by summing 5 ** (seq - 1) over its cards,
+which is unique because a rank appears at most four times.
+"""
+
+rank_keys = [0] + [5**i for i in range(13)]
+
+card_rank_keys = tuple(rank_keys[seq] for seq in card_seqs)
+card_suit_bits = tuple(1 << suit for suit in card_suits)
+# the jack matching the suit of each possible cut
+card_nobs = tuple(13 * suit + 10 for suit in card_suits)
+# each card's rank as a bit of a mask of ranks, above two bits for its suit
+card_rank_masks = tuple(1 << seq + 1 for seq in card_seqs)
+
+score_table_path = os.environ.get(
+    "CRIBBAGE_SCORE_TABLE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "score_table.bin"),
+)
+
+# bump whenever the scoring rules change so saved tables get rebuilt
+score_table_version = 2
+
+# set CRIBBAGE_REFERENCE_SCORE to anything to always use `score_direct`
+use_reference_score = bool(os.environ.get("CRIBBAGE_REFERENCE_SCORE"))
+
+_score_table: typing.Dict[int, int] = None
+
+
+def build_score_table() -> typing.Dict[int, int]:
+    """
+    Score the fifteens, pairs and runs of every multiset of 0-5 ranks
+    Return a dict of rank key to points
+    """
+    table = {}
+    for n in range(6):
+        for seqs in combinations_with_replacement(range(1, 14), n):
+            copies = [seqs[:i].count(seq) for i, seq in enumerate(seqs)]
+            if copies and max(copies) > 3:
+                continue  # only four cards of each rank
+            # the ith copy of a rank is taken from the ith suit
+            cards = [all_cards[13 * copy + seq - 1] for seq, copy in zip(seqs, copies)]
+            key = sum(rank_keys[seq] for seq in seqs)
+            table[key] = score_fifteen(cards) + score_pair(cards) + score_runs(cards)
+    return table
+
+
+@contextlib.contextmanager
+def replace_file(path: str) -> typing.Iterator[typing.BinaryIO]:
+    """
+    Open a temporary file beside `path` to write, and move it over `path`
+    once it is complete, so processes that mapped the old file keep it whole
+    """
+    f = tempfile.NamedTemporaryFile(
+        "wb", dir=os.path.dirname(os.path.abspath(path)), delete=False
+    )
+    try:
+        with f:
+            yield f
+        # temporary files are private, so give it the mode open() would
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(f.name, 0o666 & ~umask)
+        os.replace(f.name, path)
+    except BaseException:
+        os.unlink(f.name)
+        raise
+
+
+def write_score_table(table: typing.Dict[int, int], path: str) -> None:
+    """
+    Persist the table as a header of version and length,
+    an array of keys, then an array of points
+    """
+    keys = array.array("I", sorted(table))
+    points = array.array("B", [table[key] for key in keys])
+    with replace_file(path) as f:
+        array.array("I", [score_table_version, len(keys)]).tofile(f)
+        keys.tofile(f)
+        points.tofile(f)
+
+
+def read_score_table(path: str) -> typing.Dict[int, int]:
+    """Load a table written by `write_score_table`"""
+    with open(path, "rb") as f:
+        data = f.read()
+    keys = array.array("I")
+    header = array.array("I", data[: 2 * keys.itemsize])
+    if len(header) < 2 or header[0] != score_table_version:
+        raise ValueError(f"{path} is not a version {score_table_version} score table")
+    n = header[1]
+    start = 2 * keys.itemsize
+    end = start + n * keys.itemsize
+    if end + n != len(data):
+        raise ValueError(f"{path} is truncated")
+    keys.frombytes(data[start:end])
+    points = array.array("B", data[end:])
+    return dict(zip(keys, points))
+
+
+def score_table() -> typing.Dict[int, int]:
+    """
+    Return the table of points by rank key
+    Read it from disk, or build and save it on first use
+    """
+    global _score_table
+    if _score_table is None:
+        try:
+            _score_table = read_score_table(score_table_path)
+        except (OSError, ValueError):
+            _score_table = build_score_table()
+            try:
+                write_score_table(_score_table, score_table_path)
+            except OSError:
+                logger.logger.warning(f"Could not save {score_table_path}")
+    return _score_table
+
+
+def score_indices(hand: typing.Sequence[int], cut: int = None) -> int:
+    """
+    Count a hand of card indices with the score table
+
+    The hand can have up to four cards with a cut, or five without one
+    """
+    key = 0
+    suits = 0
+    for i in hand:
+        key += card_rank_keys[i]
+        suits |= card_suit_bits[i]
+    points = 0
+    if hand and not suits & (suits - 1):  # a single suit
+        points += len(hand)
+    if cut is not None:
+        key += card_rank_keys[cut]
+        if points and suits == card_suit_bits[cut]:
+            points += 1
+        if card_nobs[cut] in hand:
+            points += 1
+    return points + (_score_table or score_table())[key]
+
+
+def canonical_indices(
+    hand: typing.Sequence[int], cut: int = None
+) -> typing.Tuple[int, typing.Tuple[int, int, int, int]]:
+    """
+    Key a hand of card indices, and its cut, the same however its suits are
+    labeled, for caches that are a fraction of the size
+
+    Return the key and the permutation relabeling the hand into its
+    canonical form, as the new index of each suit, see `relabel_indices`.
+    The cut's suit comes first, then the others by the ranks held in them,
+    so flushes and his nobs score the same in the canonical form.
+
+    The key holds the seq of the cut, or 0, in its lowest 4 bits,
+    then a 13 bit mask of the ranks held in each canonical suit.
+    """
+    masks = [0, 1, 2, 3]
+    for i in hand:
+        masks[card_suits[i]] |= card_rank_masks[i]
+    key = 0
+    if cut is not None:
+        masks[card_suits[cut]] |= 1 << 15
+        key = card_seqs[cut]
+    masks.sort(reverse=True)
+    permutation = [0, 0, 0, 0]
+    for position, mask in enumerate(masks):
+        permutation[mask & 3] = position
+        key |= (mask >> 2 & 0x1FFF) << 4 + 13 * position
+    return key, tuple(permutation)
+
+
+def canonical(
+    hand: typing.List[Card], cut: Card = None
+) -> typing.Tuple[int, typing.Tuple[int, int, int, int]]:
+    """Key a hand of cards the same however its suits are labeled"""
+    return canonical_indices(
+        [card.index for card in hand], None if cut is None else cut.index
+    )
+
+
+def relabel_indices(
+    hand: typing.Sequence[int], permutation: typing.Sequence[int]
+) -> typing.List[int]:
+    """Move each card of a hand to the suit `permutation` gives for its suit"""
+    return [13 * permutation[card_suits[i]] + card_seqs[i] - 1 for i in hand]
+
+
+def count_cuts(known: int) -> typing.Tuple[typing.List[int], typing.List[int], int]:
+    """
+    Count the cards that could still be cut
+    given a bitmask of the card indices already known
+
+    Return counts by seq, counts by suit index and the total
+    """
+    ranks = [0] * 14
+    suits = [0] * 4
+    total = 0
+    for i in range(52):
+        if not known >> i & 1:
+            ranks[card_seqs[i]] += 1
+            suits[card_suits[i]] += 1
+            total += 1
+    return ranks, suits, total
+
+
+def expected_score(
+    hand: typing.Sequence[int],
+    ranks: typing.List[int],
+    suits: typing.List[int],
+    total: int,
+    flush: bool = True,
+) -> float:
+    """
+    Average score of a hand of card indices over the possible cuts
+
+    `ranks`, `suits` and `total` count the possible cuts as `count_cuts` does.
+    Cuts are grouped by rank and suit, so this takes 13 table lookups
+    however many cuts there are.
+    """
+    table = _score_table or score_table()
+    key = 0
+    suit_bits = 0
+    for i in hand:
+        key += card_rank_keys[i]
+        suit_bits |= card_suit_bits[i]
+    points = 0
+    for seq in range(1, 14):
+        if ranks[seq]:
+            points += ranks[seq] * table[key + rank_keys[seq]]
+    if flush and hand and not suit_bits & (suit_bits - 1):
+        points += len(hand) * total + suits[card_suits[hand[0]]]
+    for i in hand:
+        if card_seqs[i] == 11:
+            points += suits[card_suits[i]]  # his nobs
+    return points / total
+
+
+def expected_crib(
+    discards: typing.Sequence[int],
+    ranks: typing.List[int],
+    suits: typing.List[int],
+    total: int,
+) -> float:
+    """
+    Average points the discards score in the crib with the cut,
+    not counting whatever the other players add to it
+    """
+    return expected_score(discards, ranks, suits, total, flush=False)
+
+
+def choose_discard(
+    hand: typing.Sequence[int], known: int, n: int, dealer: bool, crib_values=True
+) -> typing.Tuple[int, ...]:
+    """
+    Return the positions in a hand of card indices to discard
+    for the best average score over the possible cuts
+
+    The dealer adds what the discards are worth in the crib,
+    other players subtract it. Crib values come from the crib table
+    when it has been built and `crib_values` is set,
+    otherwise only the discards and the cut are counted.
+    """
+    ranks, suits, total = count_cuts(known)
+    table = crib_values and n == 2 and crib_table()
+    best = None
+    for tossed in combinations(range(len(hand)), n):
+        keep = [index for i, index in enumerate(hand) if i not in tossed]
+        discards = [hand[i] for i in tossed]
+        if table:
+            crib = table[crib_table_index(discards, dealer)]
+        else:
+            crib = expected_crib(discards, ranks, suits, total)
+        value = expected_score(keep, ranks, suits, total)
+        value += crib if dealer else -crib
+        if best is None or value > best:
+            best = value
+            best_tossed = tossed
+    return best_tossed
+
+
+"""
+Table of expected crib points
+
+For each pair of cards discarded, by dealer and by pone, the average points
+in the crib once the other player has discarded and the card is cut.
+Discards are grouped by their ranks and whether they share a suit.
+"""
+
+crib_table_path = os.environ.get(
+    "CRIBBAGE_CRIB_TABLE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "crib_table.bin"),
+)
+
+crib_table_size = 2 * 13 * 13 * 2
+
+_crib_table: memoryview = None
+
+
+def crib_table_index(discards: typing.Sequence[int], dealer: bool) -> int:
+    """Position of a pair of discarded card indices in the crib table"""
+    first, second = discards
+    low, high = sorted((card_seqs[first], card_seqs[second]))
+    suited = card_suits[first] == card_suits[second]
+    return ((dealer * 13 + low - 1) * 13 + high - 1) * 2 + suited
+
+
+def load_crib_table(path: str) -> memoryview:
+    """Memory map a crib table as floats"""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    table = memoryview(mapped).cast("f")
+    if len(table) != crib_table_size:
+        raise ValueError(f"{path} is not a crib table")
+    return table
+
+
+def crib_table() -> memoryview:
+    """
+    Return the crib table, mapping it on first use
+    Return None if the table hasn't been built
+    """
+    global _crib_table
+    if _crib_table is None:
+        try:
+            _crib_table = load_crib_table(crib_table_path)
+        except (OSError, ValueError):
+            _crib_table = False
+    return _crib_table or None
+
+
+def crib_ev(discards: typing.Sequence[int], dealer: bool) -> float:
+    """
+    Expected crib points for two discarded card indices
+    Return None if the crib table hasn't been built
+    """
+    table = crib_table()
+    if table is None:
+        return None
+    return table[crib_table_index(discards, dealer)]
+
+
+def crib_table_entry(
+    dealer: bool, low: int, high: int, suited: bool, samples: int, seed
+) -> float:
+    """
+    Average the crib over `samples` random deals for one crib table entry
+
+    The discards are a card of seq `low` and one of seq `high`.
+    The other player is dealt six cards and discards with `choose_discard`
+    from the other side of the table, seeing only those six, then every
+    remaining cut is counted.
+    """
+    rng = random.Random(f"{seed}:{dealer}:{low}:{high}:{suited}")
+    discards = [low - 1, 13 * (not suited) + high - 1]
+    rest = [i for i in range(52) if i not in discards]
+    points = 0
+    for _ in range(samples):
+        dealt = rng.sample(rest, 10)  # four kept by this player, six for the other
+        known = 0
+        for i in discards + dealt:
+            known |= 1 << i
+        other = dealt[4:]
+        # the other player only sees their own six cards
+        seen = 0
+        for i in other:
+            seen |= 1 << i
+        tossed = choose_discard(other, seen, 2, not dealer, crib_values=False)
+        crib = discards + [other[i] for i in tossed]
+        points += expected_score(crib, *count_cuts(known))
+    return points / samples
+
+
+def build_crib_table(
+    path: str = None, samples: int = 1000, processes: int = None, seed=0
+) -> array.array:
+    """
+    Compute the crib table across a pool of processes and save it to `path`
+    """
+    entries = []
+    for dealer in (False, True):
+        for low in range(1, 14):
+            for high in range(1, 14):
+                for suited in (False, True):
+                    entries.append((dealer, low, high, suited and low != high))
+    # entries that can't be dealt (high below low) are left at zero
+    work = [entry for entry in entries if entry[1] <= entry[2]]
+    table = array.array("f", [0.0] * crib_table_size)
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        futures = [
+            pool.submit(crib_table_entry, *entry, samples, seed) for entry in work
+        ]
+        for entry, future in zip(work, futures):
+            dealer, low, high, suited = entry
+            points = future.result()
+            index = ((dealer * 13 + low - 1) * 13 + high - 1) * 2
+            if low == high:  # a pair can't share a suit
+                table[index] = table[index + 1] = points
+            else:
+                table[index + suited] = points
+    if path:
+        with replace_file(path) as f:
+            table.tofile(f)
+    return table
+
+
+def score(hand: typing.List[Card], cut: Card = None, reference: bool = None) -> int:
+    """
+    Count a cribbage hand
+
+    Looks up fifteens, pairs and runs in the score table.
+    Pass `reference=True` to count with `score_direct` instead.
+    """
+    if reference is None:
+        reference = use_reference_score
+    if reference or len(hand) > 4 + (not cut):
+        return score_direct(hand, cut)
+    return score_indices([card.index for card in hand], cut.index if cut else None)
+
+
+def score_batch(hands, cuts, block_size: int = 65536):
+    """
+    Score many hands of card indices at once
+
+    `hands` has shape (N, 4) and `cuts` has shape (N,).
+    With NumPy installed every rule is computed on whole columns at once
+    and an (N,) array is returned.
+    Without it, each hand goes through the score table and
+    an array.array of points is returned.
+    """
+    try:
+        import numpy
+    except ImportError:
+        return array.array("B", map(score_indices, hands, cuts))
+    hands = numpy.asarray(hands, dtype=numpy.intp)
+    cuts = numpy.asarray(cuts, dtype=numpy.intp)
+    if hands.ndim != 2 or hands.shape[1] != 4 or cuts.shape != hands.shape[:1]:
+        raise ValueError("Expected hands of shape (N, 4) and cuts of shape (N,)")
+    points = numpy.empty(len(cuts), dtype=numpy.uint8)
+    for start in range(0, len(cuts), block_size):
+        stop = start + block_size
+        points[start:stop] = _score_block(numpy, hands[start:stop], cuts[start:stop])
+    return points
+
+
+def _score_block(numpy, hands, cuts):
+    """Score one block of hands for `score_batch`"""
+    n = len(cuts)
+    cards = numpy.column_stack((hands, cuts))
+    seqs = numpy.array(card_seqs, dtype=numpy.int16)[cards]
+    values = numpy.array(card_values, dtype=numpy.int16)[cards]
+    suits = numpy.array(card_suits, dtype=numpy.int16)[cards]
+
+    # fifteens: totals of all 32 subsets, doubling the subsets card by card
+    totals = numpy.zeros((n, 1), dtype=numpy.int16)
+    for i in range(5):
+        totals = numpy.hstack((totals, totals + values[:, i : i + 1]))
+    points = 2 * (totals == 15).sum(axis=1, dtype=numpy.int16)
+
+    rows = 14 * numpy.arange(n)[:, None]
+    counts = numpy.bincount((seqs + rows).ravel(), minlength=14 * n)
+    counts = counts.reshape(n, 14)[:, 1:].astype(numpy.int16)
+
+    # pairs: n of a kind make n(n-1)/2 pairs
+    points += (counts * (counts - 1)).sum(axis=1, dtype=numpy.int16)
+
+    # runs: five cards hold at most one run, so take the longest found
+    runs = numpy.zeros(n, dtype=numpy.int16)
+    for length in (5, 4, 3):
+        windows = counts[:, : 14 - length].copy()
+        for k in range(1, length):
+            windows *= counts[:, k : 14 - length + k]
+        runs = numpy.where(runs == 0, length * windows.sum(axis=1), runs)
+    points += runs
+
+    flush = (suits[:, 1:4] == suits[:, :1]).all(axis=1)
+    points += flush * (4 + (suits[:, 4] == suits[:, 0]))
+
+    nobs = (seqs[:, :4] == 11) & (suits[:, :4] == suits[:, 4:])
+    points += nobs.any(axis=1)
+    return points
+
+
+def score_text(data: bytes, first_line: int = 1) -> bytes:
+    """
+    Score hands written one per line, four cards and then the cut,
+    returning a score per line
+    Lines are numbered from `first_line` in errors, see `parse_hands`.
+    """
+    indices = parse_hands(data, first_line=first_line)
+    try:
+        import numpy
+    except ImportError:
+        hands = [indices[i : i + 4] for i in range(0, len(indices), 5)]
+        cuts = indices[4::5]
+    else:
+        rows = numpy.frombuffer(indices, dtype=numpy.uint8).reshape(-1, 5)
+        hands, cuts = rows[:, :4], rows[:, 4]
+    points = score_batch(hands, cuts).tolist()
+    return "".join(f"{p}\n" for p in points).encode()
+
+
+def read_lines(file: typing.BinaryIO, size: int) -> typing.Iterator[bytes]:
+    """Read a binary file in chunks of about `size` bytes of whole lines"""
+    rest = b""
+    while True:
+        data = file.read(size)
+        if not data:
+            break
+        end = data.rfind(b"\n") + 1
+        if end == 0:
+            rest += data
+            continue
+        yield rest + data[:end]
+        rest = data[end:]
+    if rest:
+        yield rest
+
+
+def numbered_chunks(
+    chunks: typing.Iterable[bytes],
+) -> typing.Iterator[typing.Tuple[bytes, int]]:
+    """Pair chunks of whole lines with the number of their first line"""
+    first_line = 1
+    for chunk in chunks:
+        yield chunk, first_line
+        first_line += chunk.count(b"\n")
+
+
+def score_stream(
+    source: typing.BinaryIO,
+    sink: typing.BinaryIO,
+    processes: int = None,
+    chunk_size: int = 1 << 20,
+) -> None:
+    """
+    Score the hands in `source`, see `score_text`, and write the scores to `sink`
+
+    Chunks are scored across a pool of `processes` and written in order,
+    with only a few chunks per process in flight, so memory stays flat
+    however long the input is. With one process, score here.
+    """
+    chunks = numbered_chunks(read_lines(source, chunk_size))
+    if processes == 1:
+        for chunk, first_line in chunks:
+            sink.write(score_text(chunk, first_line))
+        return
+    window = 2 * (processes or os.cpu_count() or 1)
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        pending = collections.deque()
+        for chunk, first_line in chunks:
+            pending.append(pool.submit(score_text, chunk, first_line))
+            if len(pending) >= window:
+                sink.write(pending.popleft().result())
+        while pending:
+            sink.write(pending.popleft().result())
+
+
 def peg_fifteen(stack: typing.List[Card]) -> int:
     """If the stack totals 15, return 2, else 0"""
     points = 0
@@ -353,7 +1011,7 @@ def peg_31(stack: typing.List[Card]) -> int:
     return points
 
 
-def score_pegs(stack: typing.List[Card]) -> int:
+def score_pegs_direct(stack: typing.List[Card]) -> int:
     """
     Scoring the pegs
 
@@ -362,6 +1020,8 @@ def score_pegs(stack: typing.List[Card]) -> int:
     Scoring pegs looks at the stack,
     confirms the set to score contains the latest card, then
     returns the total points awarded.
+
+    This is the reference implementation behind `score_pegs`
     """
     # fifteen, pairs, sequence
     points = 0
@@ -379,6 +1039,198 @@ def score_pegs(stack: typing.List[Card]) -> int:
     return points
 
 
+"""
+Table for pegging runs and pairs
+
+Runs and pairs only depend on the ranks of the last few cards on the stack.
+Each state of the table stands for the ranks that can still matter:
+the trailing cards back to a repeated rank, at most six of them and
+spanning fewer than seven ranks, plus how many of the last rank were
+played in a row. A run can't be longer than seven cards without
+going over 31, so nothing before those cards can score again.
+
+For a state and the seq of the card played, `peg_table_index` gives
+the position in the points array and in the array of next states.
+"""
+
+peg_table_path = os.environ.get(
+    "CRIBBAGE_PEG_TABLE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "peg_table.bin"),
+)
+
+peg_table_version = 1
+
+_peg_table: typing.Tuple[typing.Sequence[int], typing.Sequence[int]] = None
+
+
+def peg_trail(seqs: typing.Tuple[int, ...]) -> typing.Tuple[int, ...]:
+    """
+    Trim seqs, most recent first, to the ones a later run could include
+    """
+    mask = 0
+    low = high = seqs[0]
+    for length, seq in enumerate(seqs[:6]):
+        if seq < low:
+            low = seq
+        elif seq > high:
+            high = seq
+        if mask >> seq & 1 or high - low >= 7:
+            return seqs[:length]
+        mask |= 1 << seq
+    return seqs[:6]
+
+
+def build_peg_table() -> typing.Tuple[array.array, array.array]:
+    """
+    Walk every reachable state of the pegging table
+    Return the array of points and the array of next states
+    """
+    states = {((), 0): 0}
+    queue = [((), 0)]
+    points = array.array("B")
+    next_states = array.array("I")
+    for seqs, pairs in queue:  # the queue grows as new states are found
+        for seq in range(1, 14):
+            new_pairs = pairs + 1 if seqs and seqs[0] == seq else 1
+            trail = (seq,) + seqs
+            run = 0
+            mask = 0
+            for length, previous in enumerate(trail, 1):
+                bit = 1 << previous
+                if mask & bit:
+                    break
+                mask |= bit
+                if length >= 3:
+                    shifted = mask // (mask & -mask)
+                    if not shifted & (shifted + 1):
+                        run = length
+            points.append(new_pairs * (new_pairs - 1) + run)
+            # four of a kind is the most a deck allows
+            state = (peg_trail(trail), min(new_pairs, 4))
+            if state not in states:
+                states[state] = len(queue)
+                queue.append(state)
+            next_states.append(states[state])
+    return points, next_states
+
+
+def peg_table_index(state: int, seq: int) -> int:
+    """Position in the pegging table for a state and the seq played on it"""
+    return 13 * state + seq - 1
+
+
+def write_peg_table(points: array.array, next_states: array.array, path: str):
+    """Save the table as a header of version and length, then both arrays"""
+    with replace_file(path) as f:
+        array.array("I", [peg_table_version, len(points)]).tofile(f)
+        # write() takes both built arrays and mapped views
+        f.write(next_states)
+        f.write(points)
+
+
+def load_peg_table(path: str) -> typing.Tuple[memoryview, memoryview]:
+    """Memory map a table saved by `write_peg_table`"""
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    data = memoryview(mapped)
+    version, n = data[:8].cast("I")
+    if version != peg_table_version or len(data) != 8 + 5 * n:
+        raise ValueError(f"{path} is not a version {peg_table_version} peg table")
+    return data[8 + 4 * n :], data[8 : 8 + 4 * n].cast("I")
+
+
+def peg_table() -> typing.Tuple[typing.Sequence[int], typing.Sequence[int]]:
+    """
+    Return the arrays of points and next states,
+    mapping them from disk, or building and saving them on first use
+    """
+    global _peg_table
+    if _peg_table is None:
+        try:
+            _peg_table = load_peg_table(peg_table_path)
+        except (OSError, ValueError):
+            _peg_table = build_peg_table()
+            try:
+                write_peg_table(*_peg_table, peg_table_path)
+            except OSError:
+                logger.logger.warning(f"Could not save {peg_table_path}")
+    return _peg_table
+
+
+def score_pegs(stack: typing.List[Card]) -> int:
+    """
+    Scoring the pegs
+
+    stack is the stack played, including the latest card
+
+    Feeds the last cards through the pegging table, so nothing is
+    sliced or sorted. Stacks over 31 go to `score_pegs_direct`.
+    """
+    n = len(stack)
+    total = 0
+    for card in stack:
+        total += card.value
+    if not n or total > 31:
+        return score_pegs_direct(stack)
+    points, next_states = _peg_table or peg_table()
+    state = 0
+    for i in range(max(n - 7, 0), n - 1):
+        state = next_states[13 * state + stack[i].seq - 1]
+    result = points[13 * state + stack[-1].seq - 1]
+    if total == 15:
+        result += 2
+    if total == 31:
+        result += 1
+    return result
+
+
+class PegState(object):
+    """
+    Running score of the stack during pegging
+
+    Keeps the total and the state of the pegging table,
+    so each card is scored with two array lookups.
+    Points match `score_pegs` on the whole stack.
+    """
+
+    def __init__(self, stack: typing.List[Card] = None) -> None:
+        self.stack: typing.List[Card] = [] if stack is None else stack
+        self.points, self.next_states = _peg_table or peg_table()
+        self.total = 0
+        self.state = 0
+        self.count = 0
+        for card in self.stack:
+            self.add(card)
+
+    def play(self, card: Card) -> int:
+        """Put a card on the stack and return the points it pegs"""
+        self.stack.append(card)
+        return self.add(card)
+
+    def add(self, card: Card) -> int:
+        """Score a card that was just put on the stack"""
+        i = 13 * self.state + card.seq - 1
+        self.state = self.next_states[i]
+        self.total += card.value
+        self.count += 1
+        points = self.points[i]
+        if self.total == 15:
+            points += 2
+        if self.total == 31:
+            points += 1
+        return points
+
+    def peek(self, card: Card) -> int:
+        """Return the points a card would peg without playing it"""
+        total = self.total + card.value
+        points = self.points[13 * self.state + card.seq - 1]
+        if total == 15:
+            points += 2
+        if total == 31:
+            points += 1
+        return points
+
+
 """
 Strategies for the Player class to use
 
@@ -403,6 +1255,29 @@ def human(f):
     return f
 
 
+def informed(f):
+    """
+    Set a flag so the Player passes itself to the strategy as `player`
+    Informed strategies can check things like whether the player deals
+    """
+    f.is_informed = True
+    return f
+
+
+def resolve(name: str, modules: typing.Sequence = ()) -> typing.Any:
+    """
+    Find a function by name in this module or `modules`,
+    or anywhere as module.attribute
+    """
+    if "." in name:
+        module, attribute = name.rsplit(".", 1)
+        return getattr(importlib.import_module(module), attribute)
+    for module in (sys.modules[__name__], *modules):
+        if hasattr(module, name):
+            return getattr(module, name)
+    raise ValueError(f"Unknown name {name}")
+
+
 def pick_sequence(
     hand: typing.List[Card], seen: typing.List[Card], n: int
 ) -> typing.Tuple[typing.List[Card], typing.List[Card]]:
@@ -413,6 +1288,36 @@ def pick_sequence(
     return hand, chosen
 
 
+@informed
+def pick_expected_value(
+    hand: typing.List[Card],
+    seen: typing.List[Card],
+    n: int,
+    player: "Player" = None,
+) -> typing.Tuple[typing.List[Card], typing.List[Card]]:
+    """
+    Choose the cards that leave the best average score
+
+    Every way of keeping the hand is scored against every card that could be cut,
+    see `choose_discard`
+    """
+    dealer = player is not None and player.dealer
+    # a player keeps the cards it has seen as a mask already
+    if player is not None:
+        known = player.seen_mask
+    else:
+        known = 0
+        for card in seen:
+            known |= 1 << card.index
+    for card in hand:
+        known |= 1 << card.index
+    tossed = choose_discard([card.index for card in hand], known, n, dealer)
+    chosen = [hand[i] for i in tossed]
+    for card in chosen:
+        hand.remove(card)
+    return hand, chosen
+
+
 def validate_index(indices: list, values: list) -> bool:
     """Determine if all values on list are valid indices of values"""
     valid = True
@@ -516,6 +1421,7 @@ def pegs(
     stack: typing.List[Card],
     choose=play_sequence,
     stack_max=31,
+    player: "Player" = None,
 ) -> typing.Tuple[typing.List[Card], Card]:
     """Select a card to play on the stack"""
     stack_total = sum([card.value for card in stack])
@@ -524,8 +1430,13 @@ def pegs(
     for card in hand:
         if card.value <= diff:
             possible.append(card)
+    if not possible:
+        return hand, None
+    kwargs = {}
+    if player is not None and hasattr(choose, "is_informed"):
+        kwargs["player"] = player
     try:
-        card = choose(possible, seen, stack)
+        card = choose(possible, seen, stack, **kwargs)
         hand.remove(card)
         return hand, card
     except IndexError:
@@ -550,6 +1461,9 @@ class Player(object):
             self._hand: typing.List[Card] = hand
             self.count_hand: typing.List[Card] = hand
         self._seen = set()
+        self._seen_mask = 0
+        self.dealer = False
+        self.current_hand: "Hand" = None
         self.strategy_hand = strategy_hand
         self.strategy_pegs = strategy_pegs
 
@@ -578,6 +1492,7 @@ class Player(object):
         Add card to list of cards player has seen
         """
         self._seen.add(card)
+        self._seen_mask |= 1 << card.index
 
     @property
     def hand(self):
@@ -593,11 +1508,17 @@ class Player(object):
     def seen(self):
         return list(self._seen)
 
+    @property
+    def seen_mask(self) -> int:
+        """Cards seen as a bitmask of card indices"""
+        return self._seen_mask
+
     def reshuffle(self):
         """
         Clear memory of cards seen
         """
         self._seen = set()
+        self._seen_mask = 0
         for card in self._hand:
             if isinstance(card, Card):
                 self.see(card)
@@ -608,14 +1529,21 @@ class Player(object):
         """
         crib = []
         n = len(self.hand) - 4
-        self.hand, crib = self.strategy_hand(hand=self.hand, seen=self.seen, n=n)
+        kwargs = {}
+        if hasattr(self.strategy_hand, "is_informed"):
+            kwargs["player"] = self
+        self.hand, crib = self.strategy_hand(
+            hand=self.hand, seen=self.seen, n=n, **kwargs
+        )
         return crib
 
     def play(self, stack: typing.List[Card]):
         """
         Add a card to the stack
         """
-        self.hand, card = pegs(self.hand, self.seen, stack, self.strategy_pegs)
+        self.hand, card = pegs(
+            self.hand, self.seen, stack, self.strategy_pegs, player=self
+        )
         return card
 
 
@@ -628,6 +1556,67 @@ class WinCondition(Exception):
         self.players = players
 
 
+class Metrics(object):
+    """
+    Calls and time spent per phase of a hand and per strategy
+
+    Times are nanoseconds of `time.perf_counter_ns`. Share one instance
+    between games to add them up. Without one, nothing is timed.
+    """
+
+    def __init__(self) -> None:
+        self.phases: typing.Dict[str, typing.List[int]] = {}
+        self.strategies: typing.Dict[str, typing.List[int]] = {}
+
+    @staticmethod
+    def add(group: typing.Dict[str, typing.List[int]], name: str, ns: int) -> None:
+        totals = group.get(name)
+        if totals is None:
+            totals = group[name] = [0, 0]
+        totals[0] += 1
+        totals[1] += ns
+
+    def phase(self, func: typing.Callable[[], None]) -> None:
+        """Run a phase of a hand, such as `Hand.deal`, and time it"""
+        start = time.perf_counter_ns()
+        try:
+            func()
+        finally:
+            self.add(self.phases, func.__name__, time.perf_counter_ns() - start)
+
+    def strategy(self, strategy, func: typing.Callable, *args):
+        """Return `func(*args)`, timed under the name of `strategy`"""
+        start = time.perf_counter_ns()
+        try:
+            return func(*args)
+        finally:
+            name = getattr(strategy, "__name__", type(strategy).__name__)
+            self.add(self.strategies, name, time.perf_counter_ns() - start)
+
+    def merge(self, other: "Metrics") -> None:
+        """Add the totals of another Metrics"""
+        for group, others in (
+            (self.phases, other.phases),
+            (self.strategies, other.strategies),
+        ):
+            for name, (calls, ns) in others.items():
+                totals = group.setdefault(name, [0, 0])
+                totals[0] += calls
+                totals[1] += ns
+
+    def as_dict(self) -> dict:
+        return {
+            kind: {
+                name: {"calls": calls, "seconds": ns / 1e9, "mean_us": ns / calls / 1e3}
+                for name, (calls, ns) in group.items()
+            }
+            for kind, group in (
+                ("phases", self.phases),
+                ("strategies", self.strategies),
+            )
+        }
+
+
 class Hand(object):
     """
     Playing out one hand of cribbage
@@ -641,8 +1630,14 @@ class Hand(object):
         seq=0,
         win=121,
         verbose=False,
+        headless=False,
+        rng: random.Random = None,
+        metrics: Metrics = None,
+        recorder=None,
     ) -> None:
         self.players = players
+        for player in self.players:
+            player.current_hand = self
         self.deck = deck
         if not deck:
             self.deck = build_deck()
@@ -654,12 +1649,23 @@ class Hand(object):
         self.the_cut: Card = None
         self.crib: typing.List[Card] = []
         self.stack: typing.List[Card] = []
+        self.pegging = PegState(self.stack)
         self._level = logger.default_level
         max_level = max([player.logging_level for player in self.players])
         if max_level:
             self._level = max_level
         if verbose:
             self._level = logger.console_level
+        # skip logging entirely, for simulations nobody is watching
+        self.headless = headless
+        # the global random module unless the game has its own stream
+        self.rng = random if rng is None else rng
+        # split off once per hand, so strategies drawing from it
+        # don't change the cards dealt and cut
+        self.strategy_rng = random.Random(self.rng.getrandbits(64))
+        self.metrics = metrics
+        # see records.Recorder
+        self.recorder = recorder
 
     def as_dict(self):
         return {
@@ -675,6 +1681,13 @@ class Hand(object):
             "scores": self.scores,
         }
 
+    def logs(self, log: logging.Logger, level: int) -> bool:
+        """
+        True if `log` would emit a record at `level`
+        Check before building messages so they cost nothing otherwise
+        """
+        return not self.headless and log.isEnabledFor(level)
+
     @property
     def stack_total(self):
         return sum([card.value for card in self.stack])
@@ -695,9 +1708,11 @@ class Hand(object):
         Select a card from the deck and place it in the cut
         """
         # Cut must not be in the top 5 or bottom five cards
-        i = random.randint(5, len(self.deck) - (1 + 5))
+        i = self.rng.randint(5, len(self.deck) - (1 + 5))
         self.the_cut = self.deck.pop(i)
         self.show(self.the_cut)
+        if self.recorder is not None:
+            self.recorder.cut(self)
 
         if self.the_cut.rank == "Jack":
             self.award(
@@ -711,7 +1726,11 @@ class Hand(object):
         hand_size = 4 + (4 // len(self.players))
         for i in range(0, hand_size):
             for player in self.players:
-                player.hand += [self.deck.pop()]
+                card = self.deck.pop()
+                player.hand.append(card)
+                player.see(card)
+        if self.recorder is not None:
+            self.recorder.deal(self)
 
     def collect(self) -> None:
         """
@@ -721,12 +1740,18 @@ class Hand(object):
         # each player tosses card(s) to the crib then
         # make a shallow copy of the hand to count later
         for player in self.players:
-            logger.human.log(
-                player.logging_level,
-                f"Player {self.players[len(self.players) - 1].name} gets the crib",
-            )
-            logger.hand.log(player.logging_level, "standings", extra=self.as_dict())
-            the_crib += player.toss()
+            player.dealer = player is self.players[-1]
+            if self.logs(logger.human, player.logging_level):
+                logger.human.log(
+                    player.logging_level,
+                    f"Player {self.players[len(self.players) - 1].name} gets the crib",
+                )
+            if self.logs(logger.hand, player.logging_level):
+                logger.hand.log(player.logging_level, "standings", extra=self.as_dict())
+            if self.metrics is None:
+                the_crib += player.toss()
+            else:
+                the_crib += self.metrics.strategy(player.strategy_hand, player.toss)
             player.count_hand = list(player.hand)
 
         # add cards to the crib to bring the crib size to 4
@@ -736,21 +1761,30 @@ class Hand(object):
             the_crib += [self.deck.pop()]
 
         self.crib = the_crib
+        if self.recorder is not None:
+            self.recorder.crib(self)
 
-    def award(self, player: Player, points: int, reason: str) -> None:
+    def award(self, player: Player, points: int, reason: str, **details) -> None:
         """
         Award a player points and check if they've won
+
+        `reason` is formatted with the hand's attributes and any `details`
         """
         if points < 1:
             return
-        logger.awarder.log(
-            self._level,
-            f"{player.name} | {points} | {reason.format(**self.as_dict())}",
-            extra=self.as_dict(),
-        )
+        if self.recorder is not None:
+            self.recorder.award(player, points, reason)
+        if self.logs(logger.awarder, self._level):
+            state = self.as_dict()
+            logger.awarder.log(
+                self._level,
+                f"{player.name} | {points} | {reason.format(**state, **details)}",
+                extra=state,
+            )
         player.score += points
         if player.score >= self.win:
-            logger.logger.log(self._level, f"Player {player.name} wins!")
+            if self.logs(logger.logger, self._level):
+                logger.logger.log(self._level, f"Player {player.name} wins!")
             raise WinCondition(self.players)
 
     def turn(self, i: int) -> None:
@@ -758,11 +1792,19 @@ class Hand(object):
         Player at index i adds a card to the stack
         """
         player = self.players[i]
-        logger.hand.log(
-            player.logging_level, f"{player.name} move", extra=self.as_dict()
-        )
+        if self.logs(logger.hand, player.logging_level):
+            logger.hand.log(
+                player.logging_level, f"{player.name} move", extra=self.as_dict()
+            )
         points = 0
-        card_to_play = player.play(self.stack)
+        if self.metrics is None:
+            card_to_play = player.play(self.stack)
+        else:
+            card_to_play = self.metrics.strategy(
+                player.strategy_pegs, player.play, self.stack
+            )
+        if self.recorder is not None:
+            self.recorder.play(player, card_to_play)
         if not card_to_play:
             self.go += 1
             # The last player to say go gets one point
@@ -770,8 +1812,12 @@ class Hand(object):
                 points = 1
         else:
             self.go = 0
-            self.stack.append(card_to_play)
-            points = score_pegs(self.stack)
+            pegging = self.pegging
+            if pegging.stack is not self.stack or pegging.count != len(self.stack):
+                # the stack was replaced or changed outside of play
+                pegging = self.pegging = PegState(self.stack)
+            points = pegging.play(card_to_play)
+            self.show(card_to_play)
         self.award(player, points, "pegs: {stack}")
 
     def trick(self) -> None:
@@ -802,17 +1848,27 @@ class Hand(object):
             self.award(
                 player,
                 score(player.count_hand, self.the_cut),
-                f"Player hand: {player.count_hand} plus {self.the_cut}",
+                "Player hand: {count_hand} plus {the_cut}",
+                count_hand=player.count_hand,
             )
 
         #  Last player to count gets the crib
         self.award(
             player,
             score(self.crib, self.the_cut),
-            f"Crib: {self.crib} plus {self.the_cut}",
+            "Crib: {crib} plus {the_cut}",
+            crib=self.crib,
         )
 
 
+def game_rng(seed, index: int) -> random.Random:
+    """
+    Random stream for game `index` of a run seeded with `seed`
+    Streams don't depend on each other, so any game can be replayed alone
+    """
+    return random.Random(f"{seed}:{index}")
+
+
 class Game(object):
     def __init__(
         self,
@@ -820,6 +1876,10 @@ class Game(object):
         n: int = 0,
         players: typing.List[Player] = [],
         win: int = 121,
+        headless: bool = False,
+        rng: random.Random = None,
+        metrics: Metrics = None,
+        recorder=None,
     ) -> None:
         self.name = name
 
@@ -836,6 +1896,10 @@ class Game(object):
         self.dealer_index: int = 0
         self.deck: typing.List[Card] = []
         self.win = win
+        self.headless = headless
+        self.rng = random if rng is None else rng
+        self.metrics = metrics
+        self.recorder = recorder
         self.results: dict = {}
 
     def shuffle(self):
@@ -844,7 +1908,7 @@ class Game(object):
             player.reshuffle()
         self.deck = build_deck()
         # doing this randomly, for now
-        random.shuffle(self.deck)
+        self.rng.shuffle(self.deck)
 
     def advance(self):
         """Change list of players to reflect the dealer"""
@@ -854,6 +1918,8 @@ class Game(object):
         """
         Play hands until one player wins
         """
+        if self.recorder is not None:
+            self.recorder.start(self)
         try:
             i = 0
             while True:
@@ -866,20 +1932,65 @@ class Game(object):
                     seq=i,
                     win=self.win,
                     game_name=self.name,
+                    headless=self.headless,
+                    rng=self.rng,
+                    metrics=self.metrics,
+                    recorder=self.recorder,
                 )
-                hand.deal()
-                hand.collect()
-                hand.cut()
-                hand.tricks()
-                hand.count()
+                phases = [hand.deal, hand.collect, hand.cut, hand.tricks, hand.count]
+                if self.metrics is None:
+                    for phase in phases:
+                        phase()
+                else:
+                    for phase in phases:
+                        self.metrics.phase(phase)
         except WinCondition as e:
             self.results = {
                 "players": e.players,
                 "hands": i,
             }
+            if self.metrics is not None:
+                self.results["metrics"] = self.metrics
+            if self.recorder is not None:
+                self.recorder.end(self)
+
+
+def main(argv: typing.List[str] = None):
+    parser = argparse.ArgumentParser(description="Play and study cribbage")
+    commands = parser.add_subparsers(dest="command")
+    commands.add_parser("play", help="play a game against the computer (default)")
+    crib = commands.add_parser(
+        "crib-table", help="build the table of expected crib points"
+    )
+    crib.add_argument("--path", default=crib_table_path)
+    crib.add_argument("--samples", type=int, default=1000)
+    crib.add_argument("--processes", type=int)
+    crib.add_argument("--seed", type=int, default=0)
+    scores = commands.add_parser(
+        "score", help="score hands written one per line as four cards and the cut"
+    )
+    scores.add_argument("input", nargs="?", default="-", help="file (default stdin)")
+    scores.add_argument("--output", default="-", help="file (default stdout)")
+    scores.add_argument("--processes", type=int)
+    scores.add_argument("--chunk-size", type=int, default=1 << 20, help="bytes")
+    args = parser.parse_args(argv)
+
+    if args.command == "crib-table":
+        build_crib_table(args.path, args.samples, args.processes, args.seed)
+        return
+    if args.command == "score":
+        with contextlib.ExitStack() as stack:
+            source, sink = sys.stdin.buffer, sys.stdout.buffer
+            if args.input != "-":
+                source = stack.enter_context(open(args.input, "rb"))
+            if args.output != "-":
+                sink = stack.enter_context(open(args.output, "wb"))
+            try:
+                score_stream(source, sink, args.processes, args.chunk_size)
+            except ValueError as error:
+                sys.exit(f"score: {error}")
+        return
 
-
-def main():
     players = [
         Player("Me", strategy_hand=pick_human, strategy_pegs=play_human),
         Player("1"),
@@ -0,0 +1,163 @@
+"""
+The exact distribution of hand and crib scores over every deal
+
+There are 12,994,800 ways to hold four cards and cut a fifth. Scores only
+depend on suits through flushes and his nobs, which don't change when the
+suits are relabeled, so deals are counted in classes under the 24
+relabelings and each class is scored once, weighted by its size.
+
+Relabeling the cut's suit as spades leaves the hand's other three suits
+free to be swapped. A class is then the cut's rank, the ranks the hand
+holds in spades, and the unordered ranks it holds in the other suits,
+and every deal in it has the same `cribbage.canonical_indices` key.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import math
+import typing
+from itertools import combinations
+from itertools import combinations_with_replacement
+from itertools import product
+
+import cribbage
+from cribbage import resolve
+
+deals = 52 * math.comb(51, 4)
+rank_seqs = range(1, 14)
+
+
+def partitions(n: int, parts: int = 3, most: int = 4) -> typing.Iterator[tuple]:
+    """Split n into `parts` sizes from largest to smallest, none above `most`"""
+    if parts == 0:
+        if n == 0:
+            yield ()
+        return
+    for size in range(min(n, most), -1, -1):
+        for rest in partitions(n - size, parts - 1, size):
+            yield (size,) + rest
+
+
+def other_suits(n: int) -> typing.Iterator[typing.Tuple[tuple, int]]:
+    """
+    Yield every way to hold `n` cards in three interchangeable suits,
+    as the rank tuples held in each suit, with how many relabelings of
+    those suits give different hands
+    """
+    for sizes in partitions(n):
+        groups = [
+            combinations_with_replacement(
+                combinations(rank_seqs, size), sizes.count(size)
+            )
+            for size in sorted(set(sizes), reverse=True)
+        ]
+        for held in product(*groups):
+            suits = [ranks for group in held for ranks in group]
+            repeats = 1
+            for ranks in set(suits):
+                repeats *= math.factorial(suits.count(ranks))
+            yield suits, 6 // repeats
+
+
+def classes(cut_seq: int) -> typing.Iterator[typing.Tuple[typing.List[int], int, int]]:
+    """
+    Yield each class of deals with the cut of rank `cut_seq`, as a hand of
+    card indices, the spade cut's index, and the number of deals in the class
+    """
+    spades = [seq for seq in rank_seqs if seq != cut_seq]
+    cut = cut_seq - 1
+    for n in range(5):
+        for cut_suit in combinations(spades, n):
+            for suits, weight in other_suits(4 - n):
+                hand = [seq - 1 for seq in cut_suit]
+                for suit, ranks in enumerate(suits, 1):
+                    hand += [13 * suit + seq - 1 for seq in ranks]
+                yield hand, cut, 4 * weight
+
+
+def crib_flush(hand: typing.List[int], cut: int) -> int:
+    """
+    The points a crib doesn't get that a hand would, for a flush in the
+    hand that the cut doesn't match
+    """
+    suits = {cribbage.card_suits[i] for i in hand}
+    if len(suits) == 1 and cribbage.card_suits[cut] not in suits:
+        return len(hand)
+    return 0
+
+
+def count_cut(
+    cut_seq: int, crib: bool = False, scorer=cribbage.score_indices
+) -> typing.List[int]:
+    """
+    Count the deals scoring each number of points with the cut of `cut_seq`
+    With `crib`, a flush only counts when the cut matches it
+    """
+    histogram = [0] * 30
+    for hand, cut, weight in classes(cut_seq):
+        points = scorer(hand, cut)
+        if crib:
+            points -= crib_flush(hand, cut)
+        histogram[points] += weight
+    return histogram
+
+
+def distribution(
+    crib: bool = False, scorer=cribbage.score_indices, processes: int = None
+) -> typing.List[int]:
+    """
+    Count the deals scoring each number of points, from 0 to 29
+    Each rank of cut is counted in its own task across a pool of `processes`
+    With one process, count here.
+
+    `scorer` takes a hand and cut of card indices, like `cribbage.score_indices`.
+    """
+    if processes == 1:
+        counts = [count_cut(seq, crib, scorer) for seq in rank_seqs]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+            counts = list(pool.map(count_cut, rank_seqs, [crib] * 13, [scorer] * 13))
+    return [sum(column) for column in zip(*counts)]
+
+
+def summary(histogram: typing.List[int]) -> dict:
+    """The number of deals, mean and variance of a histogram of scores"""
+    total = sum(histogram)
+    mean = sum(points * count for points, count in enumerate(histogram)) / total
+    variance = (
+        sum(count * (points - mean) ** 2 for points, count in enumerate(histogram))
+        / total
+    )
+    return {"deals": total, "mean": mean, "variance": variance, "histogram": histogram}
+
+
+def main(argv: typing.List[str] = None):
+    parser = argparse.ArgumentParser(
+        description="Count the deals scoring each number of points"
+    )
+    parser.add_argument("--crib", action="store_true", help="score crib hands")
+    parser.add_argument(
+        "--scorer",
+        default="score_indices",
+        help="scorer of card indices, in cribbage or module.name",
+    )
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args(argv)
+
+    results = summary(distribution(args.crib, resolve(args.scorer), args.processes))
+    if args.json:
+        print(json.dumps(results))
+        return
+    print("points\tdeals\tfraction")
+    for points, count in enumerate(results["histogram"]):
+        if count:
+            print(f"{points}\t{count}\t{count / results['deals']:.6f}")
+    print(f"deals\t{results['deals']}")
+    print(f"mean\t{results['mean']:.6f}")
+    print(f"variance\t{results['variance']:.6f}")
+
+
+if __name__ == "__main__":
+    main()
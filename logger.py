@@ -5,6 +5,16 @@ default_level = logging.INFO
 console_level = logging.INFO + 1
 
 
+def get_file_handler(
+    file_path: str, log_formatter: logging.Formatter
+) -> logging.FileHandler:
+    """return a file handler that opens its file on first emit"""
+    file_handler = logging.FileHandler(file_path, delay=True)
+    file_handler.setLevel(logging.INFO)
+    file_handler.setFormatter(log_formatter)
+    return file_handler
+
+
 def get_logger(
     name: str, log_format: str, file_path: str = "cribbage.log"
 ) -> logging.Logger:
@@ -13,14 +23,13 @@ def get_logger(
     configured with defaults for this project
 
     Only log to stream when the console level gets set
+    The log file isn't opened until the first record is written to it
     """
     logger = logging.getLogger(name)
 
     log_formatter = logging.Formatter(log_format)
 
-    file_handler = logging.FileHandler(file_path)
-    file_handler.setLevel(logging.INFO)
-    file_handler.setFormatter(log_formatter)
+    file_handler = get_file_handler(file_path, log_formatter)
 
     console_handler = logging.StreamHandler()
     console_handler.setLevel(console_level)
@@ -60,3 +69,24 @@ console_handler.setFormatter(log_formatter)
 human.addHandler(console_handler)
 
 human.setLevel(console_level)
+
+
+def configure_logging(file_path: str = "cribbage.log") -> None:
+    """
+    Send the hand, award and cribbage logs to `file_path`,
+    or to no file at all when it is None
+
+    Useful for worker processes that shouldn't share the default log file
+    """
+    for log, log_format in (
+        (hand, hand_format),
+        (awarder, hand_format),
+        (logger, logger_format),
+    ):
+        for handler in list(log.handlers):
+            if isinstance(handler, logging.FileHandler):
+                log.removeHandler(handler)
+                handler.close()
+        if file_path:
+            log_formatter = logging.Formatter(log_format)
+            log.addHandler(get_file_handler(file_path, log_formatter))
@@ -0,0 +1,241 @@
+"""
+Compact binary records of whole games
+
+A record file starts with an 8 byte header, b"CRIB", the format version
+and three zero bytes. Then each game follows as a little-endian u32 length
+and that many bytes of:
+
+    seed, game name          u8 length and UTF-8 text each
+    players                  u8 count, then a u8 length and UTF-8 name each
+    hands                    u16 count, then for each hand:
+        seats                a byte per player, the player numbers in the
+                             hand's order, dealer last
+        deals                u8 cards per player, then a card per byte,
+                             each player's cards in turn
+        crib                 u8 count, then a card per byte
+        cut                  a card
+        plays                u8 count, then player << 6 | card per byte,
+                             card 63 for a go
+        awards               u8 count, then two bytes each,
+                             player << 6 | reason and points
+    scores                   a byte per player
+
+Cards are their index in `cribbage.all_cards` and players are numbered
+in the order they were given to the game. A game that ends part way
+through a hand stops recording that hand where it ended.
+"""
+
+import mmap
+import typing
+
+import cribbage
+
+magic = b"CRIB"
+version = 1
+go = 63
+reasons = [
+    "pegs: {stack}",
+    "Jack in the suit",
+    "Player hand: {count_hand} plus {the_cut}",
+    "Crib: {crib} plus {the_cut}",
+]
+other_reason = 15
+
+
+def text(value) -> bytes:
+    """Encode a string with its u8 length"""
+    data = b"" if value is None else str(value).encode()[:255]
+    return bytes([len(data)]) + data
+
+
+class HandRecord(object):
+    """What happened in one hand, as card indices and player numbers"""
+
+    def __init__(self, seats: typing.List[int]) -> None:
+        self.seats = seats
+        self.deals: typing.List[typing.List[int]] = []
+        self.crib: typing.List[int] = []
+        self.cut: int = None
+        self.plays: typing.List[typing.Tuple[int, int]] = []
+        self.awards: typing.List[typing.Tuple[int, int, int]] = []
+
+    def encode(self) -> bytes:
+        data = bytearray(self.seats)
+        data.append(len(self.deals[0]) if self.deals else 0)
+        for cards in self.deals:
+            data += bytes(cards)
+        data.append(len(self.crib))
+        data += bytes(self.crib)
+        data.append(go if self.cut is None else self.cut)
+        data.append(len(self.plays))
+        for player, card in self.plays:
+            data.append(player << 6 | (go if card is None else card))
+        data.append(len(self.awards))
+        for player, reason, points in self.awards:
+            data += bytes([player << 6 | reason, points])
+        return bytes(data)
+
+
+class GameRecord(object):
+    """A game read back from a record file"""
+
+    def __init__(
+        self,
+        seed: str,
+        name: str,
+        players: typing.List[str],
+        hands: typing.List[HandRecord],
+        scores: typing.List[int],
+    ) -> None:
+        self.seed = seed
+        self.name = name
+        self.players = players
+        self.hands = hands
+        self.scores = scores
+
+
+class Recorder(object):
+    """
+    Append a record of every game it is passed to, as `Game(recorder=...)`
+
+    `file` is a path or a binary file open for appending. `seed` is saved
+    with each game, so a game seeded with `cribbage.game_rng(seed, index)`
+    and named `index` can be played again.
+    """
+
+    def __init__(self, file, seed=None) -> None:
+        self.seed = seed
+        self.owned = isinstance(file, str)
+        self.file = open(file, "ab") if self.owned else file
+        if self.file.tell() == 0:
+            self.file.write(magic + bytes([version, 0, 0, 0]))
+        self.numbers: typing.Dict[cribbage.Player, int] = {}
+        self.hands: typing.List[HandRecord] = []
+
+    def __enter__(self) -> "Recorder":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        if self.owned:
+            self.file.close()
+        else:
+            self.file.flush()
+
+    def start(self, game: "cribbage.Game") -> None:
+        """Number the players of a new game"""
+        self.game = game
+        self.numbers = {player: i for i, player in enumerate(game.players)}
+        self.hands = []
+
+    def deal(self, hand: "cribbage.Hand") -> None:
+        record = HandRecord([self.numbers[player] for player in hand.players])
+        record.deals = [[card.index for card in player.hand] for player in hand.players]
+        self.hands.append(record)
+
+    def crib(self, hand: "cribbage.Hand") -> None:
+        self.hands[-1].crib = [card.index for card in hand.crib]
+
+    def cut(self, hand: "cribbage.Hand") -> None:
+        self.hands[-1].cut = hand.the_cut.index
+
+    def play(self, player: "cribbage.Player", card: cribbage.Card) -> None:
+        index = None if card is None else card.index
+        self.hands[-1].plays.append((self.numbers[player], index))
+
+    def award(self, player: "cribbage.Player", points: int, reason: str) -> None:
+        code = reasons.index(reason) if reason in reasons else other_reason
+        self.hands[-1].awards.append((self.numbers[player], code, points))
+
+    def end(self, game: "cribbage.Game") -> None:
+        """Write the finished game to the file"""
+        players = list(self.numbers)
+        data = bytearray(text(self.seed))
+        data += text(game.name)
+        data.append(len(players))
+        for player in players:
+            data += text(player.name)
+        data += len(self.hands).to_bytes(2, "little")
+        for record in self.hands:
+            data += record.encode()
+        data += bytes(min(player.score, 255) for player in players)
+        self.file.write(len(data).to_bytes(4, "little") + data)
+        self.hands = []
+
+
+class Reader(object):
+    """
+    Iterate over the games in a record file through a memory map
+    Only the game being read is decoded, however large the file is
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self.map[:4] != magic or self.map[4] != version:
+            self.map.close()
+            raise ValueError(f"{path} is not a version {version} record file")
+
+    def __enter__(self) -> "Reader":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self.map.close()
+
+    def offsets(self) -> typing.Iterator[typing.Tuple[int, int]]:
+        """Yield the start and end of each game's bytes"""
+        data = self.map
+        position = 8
+        while position + 4 <= len(data):
+            length = int.from_bytes(data[position : position + 4], "little")
+            position += 4
+            yield position, position + length
+            position += length
+
+    def __iter__(self) -> typing.Iterator[GameRecord]:
+        for start, end in self.offsets():
+            yield decode(self.map[start:end])
+
+
+def decode(data: bytes) -> GameRecord:
+    """Decode the bytes of one game"""
+    position = 0
+
+    def read_text() -> str:
+        nonlocal position
+        length = data[position]
+        value = data[position + 1 : position + 1 + length].decode()
+        position += 1 + length
+        return value
+
+    def read_bytes(n: int) -> typing.List[int]:
+        nonlocal position
+        values = list(data[position : position + n])
+        position += n
+        return values
+
+    seed = read_text() or None
+    name = read_text()
+    players = [read_text() for _ in range(read_bytes(1)[0])]
+    n = len(players)
+    hands = []
+    for _ in range(int.from_bytes(bytes(read_bytes(2)), "little")):
+        record = HandRecord(read_bytes(n))
+        size = read_bytes(1)[0]
+        record.deals = [read_bytes(size) for _ in range(n)]
+        record.crib = read_bytes(read_bytes(1)[0])
+        cut = read_bytes(1)[0]
+        record.cut = None if cut == go else cut
+        for byte in read_bytes(read_bytes(1)[0]):
+            card = byte & 63
+            record.plays.append((byte >> 6, None if card == go else card))
+        awards = read_bytes(2 * read_bytes(1)[0])
+        for i in range(0, len(awards), 2):
+            record.awards.append((awards[i] >> 6, awards[i] & 63, awards[i + 1]))
+        hands.append(record)
+    return GameRecord(seed, name, players, hands, read_bytes(n))
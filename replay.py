@@ -0,0 +1,211 @@
+"""
+Score recorded games again and compare the points with the record
+
+Each hand is replayed from its deals, crib, cut and plays through `score`
+and `score_pegs`, or any scorers with the same signatures, and the points
+each player gets for each reason are compared with what was awarded.
+Record files are replayed in parallel, one file per task.
+"""
+
+import argparse
+import concurrent.futures
+import json
+import typing
+
+import cribbage
+import records
+from cribbage import resolve
+
+pegs, nobs, hand_count, crib_count = range(4)
+
+
+def last_count(hand: records.HandRecord) -> int:
+    """
+    How many of the counts, hands in seat order then the crib, happened
+    in the last hand of a game, which stops at the winning award
+    """
+    if not hand.awards:
+        return 0
+    player, reason, _ = hand.awards[-1]
+    if reason == crib_count:
+        return len(hand.seats) + 1
+    if reason == hand_count:
+        return hand.seats.index(player) + 1
+    return 0
+
+
+def replay_hand(
+    hand: records.HandRecord,
+    score=cribbage.score,
+    score_pegs=cribbage.score_pegs,
+    counts: int = None,
+) -> typing.Dict[typing.Tuple[int, int], int]:
+    """
+    Points for each (player, reason) from replaying a hand
+    Only the first `counts` counts are made, all of them by default
+    """
+    cards = cribbage.all_cards
+    n = len(hand.seats)
+    dealer = hand.seats[-1]
+    points = {}
+
+    def award(player, reason, value):
+        if value > 0:
+            points[player, reason] = points.get((player, reason), 0) + value
+
+    cut = cards[hand.cut]
+    if cut.rank == "Jack":
+        award(dealer, nobs, 2)
+    stack = []
+    go = 0
+    for player, index in hand.plays:
+        if index is None:
+            go += 1
+            # the last player to say go gets one point, then the stack starts over
+            if go == n:
+                award(player, pegs, 1)
+                stack = []
+                go = 0
+        else:
+            go = 0
+            stack.append(cards[index])
+            award(player, pegs, score_pegs(stack))
+
+    if counts is None:
+        counts = n + 1
+    crib = set(hand.crib)
+    for player, deal in list(zip(hand.seats, hand.deals))[:counts]:
+        kept = [cards[i] for i in deal if i not in crib]
+        award(player, hand_count, score(kept, cut))
+    if counts > n:
+        award(dealer, crib_count, score([cards[i] for i in hand.crib], cut))
+    return points
+
+
+def recorded_points(hand: records.HandRecord) -> typing.Dict[tuple, int]:
+    """Points for each (player, reason) awarded in a recorded hand"""
+    points = {}
+    for player, reason, value in hand.awards:
+        points[player, reason] = points.get((player, reason), 0) + value
+    return points
+
+
+def diff_game(
+    game: records.GameRecord, score=cribbage.score, score_pegs=cribbage.score_pegs
+) -> typing.List[dict]:
+    """Every (hand, player, reason) where the replayed points differ"""
+    diffs = []
+    for number, hand in enumerate(game.hands, 1):
+        counts = last_count(hand) if number == len(game.hands) else None
+        replayed = replay_hand(hand, score, score_pegs, counts)
+        recorded = recorded_points(hand)
+        for key in sorted(set(replayed) | set(recorded)):
+            if replayed.get(key, 0) != recorded.get(key, 0):
+                player, reason = key
+                diffs.append(
+                    {
+                        "game": game.name,
+                        "hand": number,
+                        "player": game.players[player],
+                        "reason": records.reasons[reason],
+                        "recorded": recorded.get(key, 0),
+                        "replayed": replayed.get(key, 0),
+                    }
+                )
+    return diffs
+
+
+def replay_file(
+    path: str, score=cribbage.score, score_pegs=cribbage.score_pegs, limit: int = 100
+) -> dict:
+    """Replay every game in a record file, keeping the first `limit` diffs"""
+    summary = {
+        "path": path,
+        "games": 0,
+        "hands": 0,
+        "changed_games": 0,
+        "changed_hands": 0,
+        "diffs": [],
+    }
+    with records.Reader(path) as reader:
+        for game in reader:
+            diffs = diff_game(game, score, score_pegs)
+            summary["games"] += 1
+            summary["hands"] += len(game.hands)
+            if diffs:
+                summary["changed_games"] += 1
+                summary["changed_hands"] += len({diff["hand"] for diff in diffs})
+                summary["diffs"] += diffs[: limit - len(summary["diffs"])]
+    return summary
+
+
+def replay(
+    paths: typing.List[str],
+    score=cribbage.score,
+    score_pegs=cribbage.score_pegs,
+    processes: int = None,
+    limit: int = 100,
+) -> typing.Iterator[dict]:
+    """
+    Replay record files across a pool of `processes`, in order,
+    yielding the summary of each file as it is ready
+    With one process, replay here.
+    """
+    if processes == 1:
+        for path in paths:
+            yield replay_file(path, score, score_pegs, limit)
+        return
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        futures = [
+            pool.submit(replay_file, path, score, score_pegs, limit) for path in paths
+        ]
+        for future in futures:
+            yield future.result()
+
+
+def main(argv: typing.List[str] = None):
+    parser = argparse.ArgumentParser(description="Score recorded games again")
+    parser.add_argument("paths", nargs="+", help="record files")
+    parser.add_argument(
+        "--score", default="score", help="hand scorer, in cribbage or module.name"
+    )
+    parser.add_argument(
+        "--score-pegs",
+        default="score_pegs",
+        help="pegging scorer, in cribbage or module.name",
+    )
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--limit", type=int, default=20, help="diffs per file")
+    parser.add_argument(
+        "--json", action="store_true", help="print each file's summary as JSON"
+    )
+    args = parser.parse_args(argv)
+
+    totals = dict.fromkeys(["games", "hands", "changed_games", "changed_hands"], 0)
+    for summary in replay(
+        args.paths,
+        resolve(args.score),
+        resolve(args.score_pegs),
+        args.processes,
+        args.limit,
+    ):
+        if args.json:
+            print(json.dumps(summary), flush=True)
+            continue
+        for key in totals:
+            totals[key] += summary[key]
+        for diff in summary["diffs"]:
+            print(
+                f"{summary['path']}\tgame {diff['game']}\thand {diff['hand']}\t"
+                f"{diff['player']}\t{diff['reason']}\t"
+                f"{diff['recorded']} -> {diff['replayed']}"
+            )
+    if not args.json:
+        print(
+            f"{totals['changed_games']} of {totals['games']} games and "
+            f"{totals['changed_hands']} of {totals['hands']} hands score differently"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,884 @@
+"""
+Search-based pegging strategies for the Player class
+
+Pegging only depends on ranks, so positions are keyed on rank counts,
+packed like `cribbage.rank_keys`, and on the state of the pegging table.
+"""
+
+import concurrent.futures
+import math
+import random
+import time
+import typing
+from itertools import combinations
+
+import cribbage
+from cribbage import Card
+
+seq_values = [0] + [min(seq, 10) for seq in range(1, 14)]
+
+
+class BudgetExceeded(Exception):
+    """Raised inside a search that has run out of nodes or time"""
+
+
+def seq_counts(cards: typing.Iterable[Card]) -> typing.List[int]:
+    """Count cards by seq, in a list indexed 0-13"""
+    counts = [0] * 14
+    for card in cards:
+        counts[card.seq] += 1
+    return counts
+
+
+def unseen_counts(seen: typing.Iterable[Card]) -> typing.List[int]:
+    """Count the cards not in `seen` by seq"""
+    counts = [0] + [4] * 13
+    for card in set(seen):
+        counts[card.seq] -= 1
+    return counts
+
+
+def rank_key(counts: typing.List[int]) -> int:
+    """Pack counts by seq into one int"""
+    return sum(n * cribbage.rank_keys[seq] for seq, n in enumerate(counts))
+
+
+class Expectimax(object):
+    """
+    Pegging strategy searching the rest of the pegging phase for two players
+
+    Our cards are known. The opponent holds `opp_n` cards drawn from the
+    unseen ones: they say go with the chance of holding nothing playable,
+    otherwise they play each playable rank in proportion to how many are
+    unseen. Values are our pegging points minus theirs.
+
+    The search deepens one card at a time until it covers every card left
+    or uses up `nodes` positions or `seconds`, then plays the best card of
+    the deepest finished search. Positions are kept in `table` between
+    calls, until it holds more than `table_size` of them.
+
+    Searching to the end takes hundreds of thousands of positions for the
+    first card of a hand and tens of thousands mid-hand, so the default
+    budget of 5000 runs out on most cards but the last few. That costs
+    tens of milliseconds a card, well under a second a game on one core.
+    Pass a smaller `nodes` for bulk simulations: 500 is several times faster.
+    """
+
+    is_informed = True
+
+    def __init__(
+        self, nodes: int = 5000, seconds: float = None, table_size: int = 1 << 18
+    ) -> None:
+        self.__name__ = "play_expectimax"
+        self.nodes = nodes
+        self.seconds = seconds
+        self.table_size = table_size
+        self.table: typing.Dict[tuple, float] = {}
+        self.count = 0
+        self.deadline: float = None
+
+    def __call__(
+        self,
+        possible: typing.List[Card],
+        seen: typing.List[Card],
+        stack: typing.List[Card],
+        player: "cribbage.Player" = None,
+    ) -> Card:
+        """Play the card with the best expected pegging differential"""
+        hand = player.current_hand if player else None
+        if hand is None or len(hand.players) != 2:
+            return cribbage.play_sequence(possible, seen, stack)
+        opponent = hand.players[hand.players[0] is player]
+        seq, _ = self.search(
+            seq_counts(player.hand),
+            unseen_counts(seen),
+            len(opponent.hand),
+            stack,
+            blocked=hand.go > 0,
+        )
+        for card in possible:
+            if card.seq == seq:
+                return card
+        return possible[0]
+
+    def search(
+        self,
+        mine: typing.List[int],
+        unseen: typing.List[int],
+        opp_n: int,
+        stack: typing.List[Card],
+        blocked: bool = False,
+    ) -> typing.Tuple[int, float]:
+        """
+        Return the best seq for us to play on the stack and its value
+        `mine` and `unseen` are counts by seq, see `seq_counts`
+        `blocked` is True once the opponent has said go on this stack
+        """
+        self.points, self.next_states = cribbage.peg_table()
+        pegging = cribbage.PegState(list(stack))
+        room = 31 - pegging.total
+        moves = [seq for seq in range(1, 14) if mine[seq] and seq_values[seq] <= room]
+        if not moves:
+            return None, 0.0
+        if len(self.table) > self.table_size:
+            self.table.clear()
+        self.mine = list(mine)
+        self.unseen = list(unseen)
+        self.count = 0
+        self.deadline = None
+        if self.seconds is not None:
+            self.deadline = time.perf_counter() + self.seconds
+
+        hand = rank_key(mine)
+        unseen_key = rank_key(unseen)
+        best = (moves[0], 0.0)
+        for depth in range(1, sum(mine) + opp_n + 1):
+            try:
+                values = [
+                    self.play(
+                        seq,
+                        hand,
+                        unseen_key,
+                        opp_n,
+                        pegging.state,
+                        pegging.total,
+                        0,
+                        blocked,
+                        depth,
+                    )
+                    for seq in moves
+                ]
+            except BudgetExceeded:
+                break
+            value = max(values)
+            best = (moves[values.index(value)], value)
+        return best
+
+    def value(
+        self,
+        hand: int,
+        unseen: int,
+        opp_n: int,
+        state: int,
+        total: int,
+        go: int,
+        turn: int,
+        blocked: bool,
+        depth: int,
+    ) -> float:
+        """Expected points for us minus points for them from a position"""
+        if depth == 0 and (hand or opp_n):
+            return 0.0
+        key = (
+            hand,
+            unseen,
+            state << 6 | total,
+            opp_n << 8 | go << 7 | turn << 6 | blocked << 5 | depth,
+        )
+        result = self.table.get(key)
+        if result is not None:
+            return result
+        self.count += 1
+        if self.count > self.nodes or (
+            self.deadline is not None
+            and not self.count & 255
+            and time.perf_counter() > self.deadline
+        ):
+            raise BudgetExceeded()
+
+        room = 31 - total
+        position = (hand, unseen, opp_n, state, total)
+        if turn == 0:
+            for seq in range(1, 14):
+                if self.mine[seq] and seq_values[seq] <= room:
+                    value = self.play(seq, *position, turn, blocked, depth)
+                    if result is None or value > result:
+                        result = value
+            if result is None:
+                result = self.go(*position, go, turn, blocked, depth)
+        elif blocked or not opp_n:
+            result = self.go(*position, go, turn, blocked, depth)
+        else:
+            playable = 0
+            for seq in range(1, 14):
+                if seq_values[seq] <= room:
+                    playable += self.unseen[seq]
+            n = sum(self.unseen)
+            # chance that none of their cards fit on the stack
+            p_go = 1.0
+            if playable:
+                p_go = math.comb(n - playable, opp_n) / math.comb(max(n, opp_n), opp_n)
+            result = 0.0
+            if p_go:
+                result = p_go * self.go(*position, go, turn, blocked, depth)
+            if playable:
+                for seq in range(1, 14):
+                    count = self.unseen[seq]
+                    if count and seq_values[seq] <= room:
+                        value = self.play(seq, *position, turn, blocked, depth)
+                        result += (1.0 - p_go) * count / playable * value
+        self.table[key] = result
+        return result
+
+    def play(
+        self,
+        seq: int,
+        hand: int,
+        unseen: int,
+        opp_n: int,
+        state: int,
+        total: int,
+        turn: int,
+        blocked: bool,
+        depth: int,
+    ) -> float:
+        """Value after the player to move plays a card of `seq`"""
+        i = 13 * state + seq - 1
+        total += seq_values[seq]
+        points = self.points[i]
+        if total == 15:
+            points += 2
+        if total == 31:
+            points += 1
+        key = cribbage.rank_keys[seq]
+        if turn == 0:
+            self.mine[seq] -= 1
+            value = points + self.value(
+                hand - key,
+                unseen,
+                opp_n,
+                self.next_states[i],
+                total,
+                0,
+                1,
+                blocked,
+                depth - 1,
+            )
+            self.mine[seq] += 1
+        else:
+            self.unseen[seq] -= 1
+            value = self.value(
+                hand,
+                unseen - key,
+                opp_n - 1,
+                self.next_states[i],
+                total,
+                0,
+                0,
+                blocked,
+                depth - 1,
+            )
+            value -= points
+            self.unseen[seq] += 1
+        return value
+
+    def go(
+        self,
+        hand: int,
+        unseen: int,
+        opp_n: int,
+        state: int,
+        total: int,
+        go: int,
+        turn: int,
+        blocked: bool,
+        depth: int,
+    ) -> float:
+        """
+        Value after the player to move says go
+        The second go in a row scores 1 and starts a new stack
+        """
+        if go == 0:
+            return self.value(
+                hand, unseen, opp_n, state, total, 1, 1 - turn, blocked or turn, depth
+            )
+        point = -1 if turn else 1
+        if not hand and not opp_n:
+            return point
+        return point + self.value(hand, unseen, opp_n, 0, 0, 0, 1 - turn, False, depth)
+
+
+play_expectimax = Expectimax()
+
+
+rank_space = 5**13
+# wider than any pegging differential
+limit = 1000
+exact, lower, upper = 0, 1, 2
+
+
+class Solver(object):
+    """
+    Exact alpha-beta search of the pegging phase when both hands are known
+
+    Follows the rules of `Hand.trick` for two players: a player who can't
+    play says go, the second go in a row scores 1 and starts a new stack.
+    Values are the points of the player to move minus their opponent's,
+    from now to the end of pegging.
+
+    Positions are packed into ints from the rank counts of both hands and
+    the pegging table state, and kept in `table` with alpha-beta bounds
+    until it holds more than `table_size` of them.
+    """
+
+    is_informed = True
+
+    def __init__(self, table_size: int = 1 << 20) -> None:
+        self.__name__ = "play_perfect"
+        self.table_size = table_size
+        self.table: typing.Dict[int, typing.Tuple[int, int]] = {}
+        self.nodes = 0
+
+    def __call__(
+        self,
+        possible: typing.List[Card],
+        seen: typing.List[Card],
+        stack: typing.List[Card],
+        player: "cribbage.Player" = None,
+    ) -> Card:
+        """Play the best card, looking at the opponent's hand"""
+        hand = player.current_hand if player else None
+        if hand is None or len(hand.players) != 2:
+            return cribbage.play_sequence(possible, seen, stack)
+        opponent = hand.players[hand.players[0] is player]
+        _, card = self.solve(player.hand, opponent.hand, stack, hand.go)
+        return card
+
+    def solve(
+        self,
+        mine: typing.List[Card],
+        theirs: typing.List[Card],
+        stack: typing.List[Card],
+        go: int = 0,
+    ) -> typing.Tuple[int, Card]:
+        """
+        Return the value for the player to move and their best card
+        The card is None when they have to say go
+        `go` is 1 if the opponent has just said go
+        """
+        values = self.move_values(mine, theirs, stack, go)
+        if not values:
+            return self.value(mine, theirs, stack, go), None
+        card = max(values, key=values.get)
+        return values[card], card
+
+    def move_values(
+        self,
+        mine: typing.List[Card],
+        theirs: typing.List[Card],
+        stack: typing.List[Card],
+        go: int = 0,
+    ) -> typing.Dict[Card, int]:
+        """
+        Value of each card the player to move can play, one card per rank
+        Grade a move by how far its value falls short of the best
+        """
+        self.start(mine, theirs)
+        pegging = cribbage.PegState(list(stack))
+        values = {}
+        for card in mine:
+            if card.value <= 31 - pegging.total and card.seq not in values:
+                values[card.seq] = self.play(
+                    card.seq,
+                    0,
+                    rank_key(self.counts[0]),
+                    rank_key(self.counts[1]),
+                    pegging.state,
+                    pegging.total,
+                    -limit,
+                    limit,
+                )
+        return {card: values[card.seq] for card in mine if card.seq in values}
+
+    def value(
+        self,
+        mine: typing.List[Card],
+        theirs: typing.List[Card],
+        stack: typing.List[Card],
+        go: int = 0,
+    ) -> int:
+        """Value of the position for the player to move"""
+        self.start(mine, theirs)
+        pegging = cribbage.PegState(list(stack))
+        return self.negamax(
+            0,
+            rank_key(self.counts[0]),
+            rank_key(self.counts[1]),
+            pegging.state,
+            pegging.total,
+            go,
+            -limit,
+            limit,
+        )
+
+    def start(self, mine: typing.List[Card], theirs: typing.List[Card]) -> None:
+        """Count the cards of both hands for a new search"""
+        self.points, self.next_states = cribbage.peg_table()
+        self.counts = [seq_counts(mine), seq_counts(theirs)]
+        if len(self.table) > self.table_size:
+            self.table.clear()
+
+    def negamax(
+        self,
+        turn: int,
+        hand: int,
+        other: int,
+        state: int,
+        total: int,
+        go: int,
+        alpha: int,
+        beta: int,
+    ) -> int:
+        """Value for the player to move, whose rank counts are `hand`"""
+        key = (hand * rank_space + other) << 23 | state << 7 | total << 1 | go
+        entry = self.table.get(key)
+        if entry is not None:
+            value, bound = entry
+            if bound == exact:
+                return value
+            if bound == lower and value >= beta:
+                return value
+            if bound == upper and value <= alpha:
+                return value
+        self.nodes += 1
+        start = alpha
+        counts = self.counts[turn]
+        room = 31 - total
+        moves = [
+            seq for seq in range(13, 0, -1) if counts[seq] and seq_values[seq] <= room
+        ]
+        if not moves:
+            if go:
+                if not hand and not other:
+                    return 1
+                value = 1 - self.negamax(
+                    1 - turn, other, hand, 0, 0, 0, 1 - beta, 1 - alpha
+                )
+            else:
+                value = -self.negamax(
+                    1 - turn, other, hand, state, total, 1, -beta, -alpha
+                )
+        else:
+            # try the cards that score most first
+            moves.sort(key=lambda seq: -self.points[13 * state + seq - 1])
+            value = -limit
+            for seq in moves:
+                value = max(
+                    value,
+                    self.play(seq, turn, hand, other, state, total, alpha, beta),
+                )
+                alpha = max(alpha, value)
+                if alpha >= beta:
+                    break
+        bound = exact
+        if value <= start:
+            bound = upper
+        elif value >= beta:
+            bound = lower
+        self.table[key] = (value, bound)
+        return value
+
+    def play(
+        self,
+        seq: int,
+        turn: int,
+        hand: int,
+        other: int,
+        state: int,
+        total: int,
+        alpha: int,
+        beta: int,
+    ) -> int:
+        """Value for the player to move after they play a card of `seq`"""
+        i = 13 * state + seq - 1
+        total += seq_values[seq]
+        points = self.points[i]
+        if total == 15:
+            points += 2
+        if total == 31:
+            points += 1
+        self.counts[turn][seq] -= 1
+        value = points - self.negamax(
+            1 - turn,
+            other,
+            hand - cribbage.rank_keys[seq],
+            self.next_states[i],
+            total,
+            0,
+            points - beta,
+            points - alpha,
+        )
+        self.counts[turn][seq] += 1
+        return value
+
+
+play_perfect = Solver()
+
+
+class Pegging(object):
+    """
+    Bare pegging phase for two players, on lists of seqs
+
+    A fast stand-in for `Hand.tricks` in rollouts, with the same go rules.
+    Moves are seqs, or 0 to say go.
+    """
+
+    __slots__ = ("hands", "turn", "state", "total", "go", "scores", "done")
+
+    def __init__(
+        self,
+        hands: typing.List[typing.List[int]],
+        turn: int = 0,
+        state: int = 0,
+        total: int = 0,
+        go: int = 0,
+    ) -> None:
+        self.hands = hands
+        self.turn = turn
+        self.state = state
+        self.total = total
+        self.go = go
+        self.scores = [0, 0]
+        self.done = False
+
+    def moves(self) -> typing.List[int]:
+        """Seqs the player to move can play, or [0] if they have to say go"""
+        room = 31 - self.total
+        moves = sorted(
+            {seq for seq in self.hands[self.turn] if seq_values[seq] <= room}
+        )
+        return moves or [0]
+
+    def points(self, seq: int) -> int:
+        """Points for playing a card of `seq`"""
+        points, _ = cribbage.peg_table()
+        total = self.total + seq_values[seq]
+        result = points[13 * self.state + seq - 1]
+        if total == 15:
+            result += 2
+        if total == 31:
+            result += 1
+        return result
+
+    def apply(self, seq: int) -> None:
+        """Play a card of `seq`, or say go for 0, and pass the turn"""
+        if seq:
+            _, next_states = cribbage.peg_table()
+            self.scores[self.turn] += self.points(seq)
+            self.state = next_states[13 * self.state + seq - 1]
+            self.total += seq_values[seq]
+            self.hands[self.turn].remove(seq)
+            self.go = 0
+        else:
+            self.go += 1
+            if self.go == 2:
+                self.scores[self.turn] += 1
+                self.state = self.total = self.go = 0
+                self.done = not self.hands[0] and not self.hands[1]
+        self.turn = 1 - self.turn
+
+    def rollout(self, rng: random.Random) -> None:
+        """Finish pegging, each player playing the card that scores most now"""
+        while not self.done:
+            moves = self.moves()
+            if len(moves) > 1:
+                rng.shuffle(moves)
+                moves.sort(key=self.points, reverse=True)
+            self.apply(moves[0])
+
+
+def best_keep(hand: typing.List[int], n: int) -> typing.Tuple[list, list]:
+    """Split a hand of card indices into the best scoring keep and `n` discards"""
+    keep = max(combinations(hand, len(hand) - n), key=cribbage.score_indices)
+    return list(keep), [i for i in hand if i not in keep]
+
+
+class Node(object):
+    """Statistics for a move in the search tree"""
+
+    __slots__ = ("player", "children", "visits", "reward", "available")
+
+    def __init__(self, player: int) -> None:
+        self.player = player
+        self.children: typing.Dict[int, Node] = {}
+        self.visits = 0
+        self.reward = 0.0
+        self.available = 1
+
+
+def search_worker(
+    kind: str, position: tuple, simulations: int, seconds: float, exploration, seed
+) -> typing.Dict[typing.Any, typing.List[float]]:
+    """Run one share of a search in a pool process"""
+    strategy = ISMCTS(simulations, seconds, exploration=exploration, seed=seed)
+    return strategy.search(kind, position)
+
+
+class ISMCTS(object):
+    """
+    Information set Monte Carlo tree search for both phases of a hand
+
+    Every simulation deals the cards the player hasn't seen at random, so
+    the hidden cards are consistent with `Player.seen`, then plays on
+    through the tree and out to the end of the hand with `Pegging`.
+    Rewards are the points of the player minus their opponent's.
+
+    `pick_ismcts` searches the discards, dealing the opponent a hand that
+    keeps its best four cards and a cut. `play_ismcts` searches the
+    pegging, with a tree of moves for both players. Each decision runs
+    `simulations`, or for `seconds` if that is set. With `processes`, the
+    simulations are shared out across a pool and the counts merged.
+
+    Without a `seed`, simulations draw from the hand's `strategy_rng`,
+    split from the game's stream, so seeded games replay exactly and deal
+    the same cards whatever plays them. With `seconds`, the number of
+    simulations depends on how fast the machine is, so games don't replay.
+    """
+
+    def __init__(
+        self,
+        simulations: int = 300,
+        seconds: float = None,
+        processes: int = None,
+        exploration: float = 4.0,
+        seed=None,
+    ) -> None:
+        self.simulations = simulations
+        self.seconds = seconds
+        self.processes = processes
+        self.exploration = exploration
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.pool: concurrent.futures.ProcessPoolExecutor = None
+
+    def __getstate__(self) -> dict:
+        state = dict(self.__dict__)
+        state["pool"] = None
+        return state
+
+    def close(self) -> None:
+        """Shut down the pool of processes, if there is one"""
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    @cribbage.informed
+    def pick_ismcts(
+        self,
+        hand: typing.List[Card],
+        seen: typing.List[Card],
+        n: int,
+        player: "cribbage.Player" = None,
+    ) -> typing.Tuple[typing.List[Card], typing.List[Card]]:
+        """Discard the cards with the best average result"""
+        game = player.current_hand if player else None
+        if game is None or len(game.players) != 2:
+            return cribbage.pick_sequence(hand, seen, n)
+        indices = [card.index for card in hand]
+        known = {card.index for card in seen} | set(indices)
+        unseen = [i for i in range(52) if i not in known]
+        rng = game.strategy_rng if self.seed is None else self.rng
+        stats = self.run("pick", (indices, unseen, n, player.dealer), rng)
+        discards = max(stats, key=lambda move: stats[move][0])
+        chosen = [card for card in hand if card.index in discards]
+        return [card for card in hand if card.index not in discards], chosen
+
+    @cribbage.informed
+    def play_ismcts(
+        self,
+        possible: typing.List[Card],
+        seen: typing.List[Card],
+        stack: typing.List[Card],
+        player: "cribbage.Player" = None,
+    ) -> Card:
+        """Play the card searched most"""
+        game = player.current_hand if player else None
+        if game is None or len(game.players) != 2:
+            return cribbage.play_sequence(possible, seen, stack)
+        if len({card.seq for card in possible}) == 1:
+            return possible[0]
+        opponent = game.players[game.players[0] is player]
+        known = {card.index for card in seen} | {card.index for card in player.hand}
+        unseen = [i for i in range(52) if i not in known]
+        pegging = cribbage.PegState(list(stack))
+        position = (
+            [card.seq for card in player.hand],
+            unseen,
+            len(opponent.hand),
+            pegging.state,
+            pegging.total,
+            game.go,
+        )
+        rng = game.strategy_rng if self.seed is None else self.rng
+        stats = self.run("play", position, rng)
+        seq = max(stats, key=lambda move: stats[move][0])
+        for card in possible:
+            if card.seq == seq:
+                return card
+        return possible[0]
+
+    def run(
+        self, kind: str, position: tuple, rng: random.Random
+    ) -> typing.Dict[typing.Any, list]:
+        """Search here or across the pool, returning visits and reward by move"""
+        if not self.processes or self.processes < 2:
+            return self.search(kind, position, rng)
+        if self.pool is None:
+            self.pool = concurrent.futures.ProcessPoolExecutor(self.processes)
+        share = -(-self.simulations // self.processes)
+        futures = [
+            self.pool.submit(
+                search_worker,
+                kind,
+                position,
+                share,
+                self.seconds,
+                self.exploration,
+                rng.random(),
+            )
+            for _ in range(self.processes)
+        ]
+        stats = {}
+        for future in futures:
+            for move, (visits, reward) in future.result().items():
+                total = stats.setdefault(move, [0, 0.0])
+                total[0] += visits
+                total[1] += reward
+        return stats
+
+    def search(
+        self, kind: str, position: tuple, rng: random.Random = None
+    ) -> typing.Dict[typing.Any, list]:
+        """Run the simulations for a decision in this process"""
+        deadline = None
+        if self.seconds is not None:
+            deadline = time.perf_counter() + self.seconds
+        if rng is None:
+            rng = self.rng
+        if kind == "pick":
+            return self.search_pick(*position, deadline, rng)
+        return self.search_play(*position, deadline, rng)
+
+    def budget(self, i: int, deadline: float) -> bool:
+        """True while there are simulations or time left"""
+        if deadline is not None:
+            return not i or time.perf_counter() < deadline
+        return i < self.simulations
+
+    def ucb(self, visits: int, reward: float, available: int) -> float:
+        return reward / visits + self.exploration * math.sqrt(
+            math.log(available) / visits
+        )
+
+    def search_pick(
+        self,
+        hand: list,
+        unseen: list,
+        n: int,
+        dealer: bool,
+        deadline: float,
+        rng: random.Random,
+    ) -> typing.Dict[tuple, list]:
+        """Pick discards as arms of a bandit, each pull a new deal"""
+        stats = {discards: [0, 0.0] for discards in combinations(hand, n)}
+        moves = list(stats)
+        i = 0
+        while self.budget(i, deadline):
+            i += 1
+            if i <= len(moves):
+                discards = moves[i - 1]
+            else:
+                discards = max(moves, key=lambda move: self.ucb(*stats[move], i))
+            keep = [index for index in hand if index not in discards]
+            dealt = rng.sample(unseen, len(hand) + 1)
+            cut = dealt.pop()
+            their_keep, their_discards = best_keep(dealt, n)
+            pegging = Pegging(
+                [
+                    [cribbage.card_seqs[index] for index in keep],
+                    [cribbage.card_seqs[index] for index in their_keep],
+                ],
+                turn=int(dealer),  # the player who doesn't deal leads
+            )
+            pegging.rollout(rng)
+            reward = pegging.scores[0] - pegging.scores[1]
+            reward += cribbage.score_indices(keep, cut)
+            reward -= cribbage.score_indices(their_keep, cut)
+            crib = cribbage.score_indices(list(discards) + their_discards, cut)
+            reward += crib if dealer else -crib
+            stats[discards][0] += 1
+            stats[discards][1] += reward
+        return stats
+
+    def search_play(
+        self,
+        hand: list,
+        unseen: list,
+        opp_n: int,
+        state: int,
+        total: int,
+        go: int,
+        deadline: float,
+        rng: random.Random,
+    ) -> typing.Dict[int, list]:
+        """Grow a tree of pegging moves over random deals of the unseen cards"""
+        room = 31 - total
+        root = Node(1)
+        i = 0
+        while self.budget(i, deadline):
+            i += 1
+            theirs = rng.sample(unseen, opp_n)
+            if go:
+                # they said go, so deal them nothing that fits, if possible
+                for _ in range(20):
+                    if all(cribbage.card_values[index] > room for index in theirs):
+                        break
+                    theirs = rng.sample(unseen, opp_n)
+            pegging = Pegging(
+                [list(hand), [cribbage.card_seqs[index] for index in theirs]],
+                state=state,
+                total=total,
+                go=go,
+            )
+            node = root
+            path = []
+            while not pegging.done:
+                moves = pegging.moves()
+                untried = []
+                for move in moves:
+                    child = node.children.get(move)
+                    if child is None:
+                        untried.append(move)
+                    else:
+                        child.available += 1
+                if untried:
+                    move = rng.choice(untried)
+                    child = node.children[move] = Node(pegging.turn)
+                    pegging.apply(move)
+                    path.append(child)
+                    break
+                move = max(
+                    moves,
+                    key=lambda move: self.ucb(
+                        node.children[move].visits,
+                        node.children[move].reward,
+                        node.children[move].available,
+                    ),
+                )
+                node = node.children[move]
+                pegging.apply(move)
+                path.append(node)
+            pegging.rollout(rng)
+            for node in path:
+                node.visits += 1
+                node.reward += (
+                    pegging.scores[node.player] - pegging.scores[1 - node.player]
+                )
+        return {
+            move: [child.visits, child.reward] for move, child in root.children.items()
+        }
+
+
+ismcts = ISMCTS()
+pick_ismcts = ismcts.pick_ismcts
+play_ismcts = ismcts.play_ismcts
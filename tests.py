@@ -1,17 +1,68 @@
 """
 Tests for the cribbage module
 """
+import contextlib
+import importlib.util
+import io
+import itertools
+import json
 import logging
+import os
+import pickle
+import random
+import subprocess
+import sys
+import tempfile
 import unittest
+import unittest.mock
 
+import bench
 import cribbage
+import distribution
 import logger
+import records
+import replay
+import search
+import tournament
 
 logger.logger.setLevel(logging.ERROR)
 logger.awarder.setLevel(logging.ERROR)
 logger.hand.setLevel(logging.ERROR)
 
 
+class TestLogger(unittest.TestCase):
+    """Logging is set up without touching the filesystem"""
+
+    def test_import(self):
+        """Importing cribbage doesn't create the log file"""
+        here = os.path.dirname(os.path.abspath(__file__))
+        env = dict(os.environ, PYTHONPATH=here)
+        with tempfile.TemporaryDirectory() as directory:
+            subprocess.run(
+                [sys.executable, "-c", "import cribbage"],
+                cwd=directory,
+                env=env,
+                check=True,
+            )
+            self.assertEqual(os.listdir(directory), [])
+
+    def test_configure(self):
+        def files(log):
+            return [h for h in log.handlers if isinstance(h, logging.FileHandler)]
+
+        try:
+            logger.configure_logging(None)
+            self.assertEqual(files(logger.hand), [])
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "other.log")
+                logger.configure_logging(path)
+                self.assertEqual(files(logger.awarder)[0].baseFilename, path)
+                logger.configure_logging(None)
+        finally:
+            logger.configure_logging()
+        self.assertEqual(len(files(logger.logger)), 1)
+
+
 class TestStrategyHuman(unittest.TestCase):
     """Human strategy elements work as intended"""
 
@@ -122,6 +173,680 @@ class TestStrategySequence(unittest.TestCase):
         self.assertIsNone(card)
 
 
+class TestStrategyExpectedValue(unittest.TestCase):
+    """Expected value strategy keeps the best hand"""
+
+    def pick(self, hand_strings, dealer):
+        hand = [cribbage.card_from_string(s) for s in hand_strings]
+        player = cribbage.Player(hand=hand)
+        player.dealer = dealer
+        return cribbage.pick_expected_value(list(hand), list(hand), 2, player)
+
+    def test_keeps_points(self):
+        hand, crib = self.pick(["5H", "5S", "5D", "JC", "KD", "2C"], False)
+        self.assertCountEqual([card.name for card in hand], ["5H", "5S", "5D", "JC"])
+        self.assertCountEqual([card.name for card in crib], ["KD", "2C"])
+
+    def test_dealer(self):
+        """The dealer weighs what the discards add to their crib"""
+        hand_strings = ["AH", "3D", "4S", "7H", "4D", "AD"]
+        hand, crib = self.pick(hand_strings, True)
+        self.assertCountEqual([card.name for card in crib], ["AH", "AD"])
+        hand, crib = self.pick(hand_strings, False)
+        self.assertCountEqual([card.name for card in crib], ["3D", "7H"])
+
+    def test_player(self):
+        """Players pass themselves to informed strategies"""
+        player = cribbage.Player(strategy_hand=cribbage.pick_expected_value)
+        player.hand = cribbage.draw_hand(cribbage.build_deck(), 6)
+        crib = player.toss()
+        self.assertEqual(len(player.hand), 4)
+        self.assertEqual(len(crib), 2)
+
+    def test_seen_mask(self):
+        """A player's mask of seen cards counts the same as the list"""
+        deck = cribbage.build_deck()
+        random.Random(8).shuffle(deck)
+        player = cribbage.Player(hand=deck[:6])
+        for card in deck[6:20]:
+            player.see(card)
+        self.assertEqual(
+            cribbage.pick_expected_value(deck[:6], player.seen, 2, player),
+            cribbage.pick_expected_value(deck[:6], player.seen, 2),
+        )
+
+    def test_collect_dealer(self):
+        """The last player deals"""
+        players = [cribbage.Player("1"), cribbage.Player("2")]
+        hand = cribbage.Hand(players)
+        hand.deal()
+        hand.collect()
+        self.assertEqual([player.dealer for player in players], [False, True])
+
+
+class TestStrategyExpectimax(unittest.TestCase):
+    """Expectimax strategy searches the rest of the pegging"""
+
+    def cards(self, strings):
+        return [cribbage.card_from_string(s) for s in strings]
+
+    def search(self, hand_strings, stack_strings, opp_n=0, **kwargs):
+        hand = self.cards(hand_strings)
+        stack = self.cards(stack_strings)
+        return search.Expectimax(**kwargs).search(
+            search.seq_counts(hand),
+            search.unseen_counts(hand + stack),
+            opp_n,
+            stack,
+        )
+
+    def test_31(self):
+        seq, value = self.search(["QC", "4C"], ["KS", "JH", "AD"])
+        self.assertEqual(seq, 12)
+        # 31 for 2, then the 4 and the last go for 1
+        self.assertEqual(value, 3)
+
+    def test_last_card(self):
+        self.assertEqual(self.search(["5C"], []), (5, 1))
+        self.assertEqual(self.search(["5C"], ["KS"]), (5, 3))
+
+    def test_nothing_to_play(self):
+        self.assertEqual(self.search(["KC"], ["KS", "QH", "5D"]), (None, 0))
+
+    def test_opponent(self):
+        """Avoid leaving a fifteen when the opponent holds cards"""
+        seq, value = self.search(["5C", "4C"], [], opp_n=4)
+        self.assertEqual(seq, 4)
+
+    def test_budget(self):
+        """A tiny budget still plays a legal card"""
+        seq, value = self.search(["5C", "4C", "9D", "QH"], [], 4, nodes=1)
+        self.assertIn(seq, [4, 5, 9, 12])
+        seq, value = self.search(["5C", "4C", "9D", "QH"], [], 4, seconds=0)
+        self.assertIn(seq, [4, 5, 9, 12])
+
+    def test_table(self):
+        strategy = search.Expectimax(table_size=10)
+        strategy.search([0, 1, 1] + [0] * 11, [0] + [4] * 13, 2, [])
+        self.assertTrue(strategy.table)
+        strategy.search([0, 1, 1] + [0] * 11, [0] + [4] * 13, 2, [])
+        self.assertLessEqual(len(strategy.table), 10 + strategy.count)
+
+    def test_fallback(self):
+        """Without a two player hand, play in sequence"""
+        possible = self.cards(["5C", "4C"])
+        card = search.play_expectimax(possible, [], [])
+        self.assertEqual(card.name, "5C")
+
+    def test_game(self):
+        players = [
+            cribbage.Player("1", strategy_pegs=search.Expectimax(nodes=500)),
+            cribbage.Player("2", strategy_pegs=search.Expectimax(seconds=0.01)),
+        ]
+        game = cribbage.Game(players=players, headless=True)
+        game.play()
+        self.assertTrue(game.results)
+        self.assertEqual(repr(players[0]).count("play_expectimax"), 1)
+
+
+class TestStrategyPerfect(unittest.TestCase):
+    """Solver plays pegging exactly when both hands are known"""
+
+    def cards(self, strings):
+        return [cribbage.card_from_string(s) for s in strings]
+
+    def brute(self, mine, theirs, stack, go=0):
+        """Plain minimax over the rules of Hand.trick"""
+        total = sum(card.value for card in stack)
+        moves = [card for card in mine if card.value <= 31 - total]
+        if not moves:
+            if not go:
+                return -self.brute(theirs, mine, stack, 1)
+            if not mine and not theirs:
+                return 1
+            return 1 - self.brute(theirs, mine, [], 0)
+        values = []
+        for card in moves:
+            rest = [other for other in mine if other is not card]
+            values.append(
+                cribbage.score_pegs(stack + [card])
+                - self.brute(theirs, rest, stack + [card])
+            )
+        return max(values)
+
+    def test_brute_force(self):
+        rng = random.Random(14)
+        solver = search.Solver()
+        deck = cribbage.build_deck()
+        for i in range(100):
+            rng.shuffle(deck)
+            mine, theirs = deck[:4], deck[4:8]
+            with self.subTest(mine=mine, theirs=theirs):
+                value, card = solver.solve(mine, theirs, [])
+                self.assertEqual(value, self.brute(mine, theirs, []))
+                self.assertIn(card, mine)
+                values = solver.move_values(mine, theirs, [])
+                self.assertEqual(values[card], value)
+
+    def test_go(self):
+        """Nothing fits on the stack, so say go"""
+        mine, theirs = self.cards(["KC", "QC"]), self.cards(["AS"])
+        stack = self.cards(["KS", "QH", "JD"])
+        value, card = search.Solver().solve(mine, theirs, stack)
+        self.assertIsNone(card)
+        # they play the ace for 31 and the go, then we play the last card
+        self.assertEqual(value, -2 + 1)
+        self.assertEqual(value, self.brute(mine, theirs, stack))
+
+    def test_31(self):
+        mine, theirs = self.cards(["QC", "4C"]), self.cards(["6S"])
+        value, card = search.Solver().solve(
+            mine, theirs, self.cards(["KS", "JH", "AD"])
+        )
+        self.assertEqual(card.name, "QC")
+
+    def test_game(self):
+        players = [
+            cribbage.Player("1", strategy_pegs=search.play_perfect),
+            cribbage.Player("2", strategy_pegs=search.Expectimax(nodes=200)),
+        ]
+        game = cribbage.Game(players=players, headless=True)
+        game.play()
+        self.assertTrue(game.results)
+
+
+class TestStrategyISMCTS(unittest.TestCase):
+    """Monte Carlo strategies play both phases of a hand"""
+
+    def setUp(self) -> None:
+        self.strategy = search.ISMCTS(simulations=50, seed=15)
+        self.player = cribbage.Player(
+            "mc",
+            strategy_hand=self.strategy.pick_ismcts,
+            strategy_pegs=self.strategy.play_ismcts,
+        )
+        self.hand = cribbage.Hand([cribbage.Player("other"), self.player])
+        self.hand.deal()
+        return super().setUp()
+
+    def test_pegging(self):
+        pegging = search.Pegging([[5, 13], [10, 1]])
+        for seq in [5, 10, 13, 1]:
+            self.assertIn(seq, pegging.moves())
+            pegging.apply(seq)
+        self.assertEqual(pegging.moves(), [0])
+        pegging.apply(0)
+        pegging.apply(0)
+        self.assertTrue(pegging.done)
+        self.assertEqual(pegging.scores, [0, 3])
+
+    def test_rollout(self):
+        pegging = search.Pegging([[5, 13, 4, 4], [10, 1, 7, 9]], turn=1)
+        pegging.rollout(random.Random(15))
+        self.assertTrue(pegging.done)
+        self.assertEqual(pegging.hands, [[], []])
+
+    def test_pick(self):
+        crib = self.player.toss()
+        self.assertEqual(len(self.player.hand), 4)
+        self.assertEqual(len(crib), 2)
+
+    def test_play(self):
+        self.hand.collect()
+        self.hand.cut()
+        self.hand.tricks()
+        self.assertEqual(self.player.hand, [])
+
+    def test_seconds(self):
+        self.strategy.seconds = 0.01
+        self.hand.collect()
+        self.hand.cut()
+        self.hand.tricks()
+        self.assertEqual(self.player.hand, [])
+
+    def test_processes(self):
+        self.strategy.processes = 2
+        try:
+            crib = self.player.toss()
+        finally:
+            self.strategy.close()
+        self.assertEqual(len(crib), 2)
+        self.assertIsNone(pickle.loads(pickle.dumps(self.strategy)).pool)
+
+    def test_game_rng(self):
+        """Unseeded, simulations follow the game's stream"""
+        outcomes = []
+        for _ in range(2):
+            strategy = search.ISMCTS(simulations=20)
+            players = [
+                cribbage.Player(
+                    name,
+                    strategy_hand=strategy.pick_ismcts,
+                    strategy_pegs=strategy.play_ismcts,
+                )
+                for name in ["1", "2"]
+            ]
+            game = cribbage.Game(
+                players=players, headless=True, rng=cribbage.game_rng(0, 17)
+            )
+            game.play()
+            outcomes.append([(p.name, p.score) for p in game.results["players"]])
+        self.assertEqual(outcomes[0], outcomes[1])
+
+    def test_same_deals(self):
+        """Searching doesn't change the cards a seeded game deals"""
+        strategy = search.ISMCTS(simulations=20)
+        deals = []
+        with tempfile.TemporaryDirectory() as directory:
+            for pick, play in [
+                (strategy.pick_ismcts, strategy.play_ismcts),
+                (cribbage.pick_sequence, cribbage.play_sequence),
+            ]:
+                path = os.path.join(directory, f"{len(deals)}.crib")
+                players = [
+                    cribbage.Player(name, strategy_hand=pick, strategy_pegs=play)
+                    for name in ["1", "2"]
+                ]
+                with records.Recorder(path) as recorder:
+                    cribbage.Game(
+                        players=players,
+                        headless=True,
+                        rng=cribbage.game_rng(0, 18),
+                        recorder=recorder,
+                    ).play()
+                with records.Reader(path) as reader:
+                    [game] = list(reader)
+                deals.append([(hand.deals, hand.cut) for hand in game.hands])
+        n = min(len(hands) for hands in deals)
+        self.assertEqual(deals[0][:n], deals[1][:n])
+
+    def test_fallback(self):
+        """Without a two player hand, fall back to sequence"""
+        hand = [cribbage.card_from_string(s) for s in ["5C", "4C", "3C"]]
+        self.assertEqual(search.play_ismcts(list(hand), [], []).name, "5C")
+        kept, chosen = search.pick_ismcts(list(hand), [], 1)
+        self.assertEqual([card.name for card in chosen], ["5C"])
+
+
+class TestTournament(unittest.TestCase):
+    """Tournaments add up games played in chunks"""
+
+    def test_parse_player(self):
+        self.assertEqual(
+            tournament.parse_player("mc=pick_ismcts,play_ismcts"),
+            ("mc", "pick_ismcts", "play_ismcts"),
+        )
+        self.assertEqual(
+            tournament.parse_player("1"), ("1", "pick_sequence", "play_sequence")
+        )
+
+    def test_resolve(self):
+        self.assertIs(tournament.resolve("play_sequence"), cribbage.play_sequence)
+        self.assertIs(tournament.resolve("play_perfect"), search.play_perfect)
+        self.assertIs(tournament.resolve("search.play_perfect"), search.play_perfect)
+        with self.assertRaises(ValueError):
+            tournament.resolve("play_nothing")
+        with self.assertRaises(ValueError):
+            tournament.resolve("play_human")
+
+    def test_skunks(self):
+        players = [cribbage.Player(name) for name in ["a", "b", "c"]]
+        for player, score in zip(players, [121, 90, 60]):
+            player.score = score
+        stats = tournament.Stats(["a", "b", "c"])
+        stats.add(players, 9)
+        results = stats.as_dict()
+        self.assertEqual(results["average_margin"], 31)
+        self.assertEqual((results["skunks"], results["double_skunks"]), (1, 1))
+        self.assertEqual(results["players"]["a"]["wins"], 1)
+        self.assertEqual(results["players"]["b"]["skunked"], 1)
+        self.assertEqual(results["players"]["c"]["double_skunked"], 1)
+
+    def test_stream(self):
+        specs = [
+            tournament.parse_player(spec) for spec in ["ev=pick_expected_value", "seq"]
+        ]
+        totals = [
+            stats.as_dict()
+            for stats in tournament.tournament(specs, 10, 1, chunk_size=4, seed=16)
+        ]
+        self.assertEqual([stats["games"] for stats in totals], [4, 8, 10])
+        players = totals[-1]["players"]
+        self.assertEqual(players["ev"]["wins"] + players["seq"]["wins"], 10)
+        again = list(tournament.tournament(specs, 10, 1, chunk_size=4, seed=16))
+        self.assertEqual(again[-1].as_dict(), totals[-1])
+
+    def test_processes(self):
+        specs = [tournament.parse_player(spec) for spec in ["1", "2"]]
+        stats = list(tournament.tournament(specs, 6, 2, chunk_size=2, seed=16))
+        self.assertEqual(len(stats), 3)
+        self.assertEqual(stats[-1].games, 6)
+        single = list(tournament.tournament(specs, 6, 1, chunk_size=2, seed=16))
+        self.assertEqual(stats[-1].as_dict(), single[-1].as_dict())
+
+    def test_keeps_logging(self):
+        """Playing in this process leaves the caller's log handlers alone"""
+        logs = [logger.hand, logger.awarder, logger.logger]
+        handlers = [list(log.handlers) for log in logs]
+        specs = [tournament.parse_player(spec) for spec in ["1", "2"]]
+        list(tournament.tournament(specs, 2, 1))
+        tournament.play_games(specs, 0, 1)
+        self.assertEqual([list(log.handlers) for log in logs], handlers)
+
+    def test_replay(self):
+        """Any game of a seeded run replays alone"""
+        specs = [tournament.parse_player(spec) for spec in ["1", "2"]]
+        chunk = tournament.play_games(specs, 4, 4, seed=17)
+        strategies = [
+            (name, tournament.resolve(pick), tournament.resolve(play))
+            for name, pick, play in specs
+        ]
+        replayed = tournament.Stats(["1", "2"])
+        for i in [7, 5, 6, 4]:
+            game = tournament.play_game(strategies, i, seed=17)
+            replayed.add(game.results["players"], game.results["hands"])
+        self.assertEqual(replayed.as_dict(), chunk.as_dict())
+
+    def test_metrics(self):
+        specs = [tournament.parse_player(spec) for spec in ["1", "2"]]
+        stats = list(tournament.tournament(specs, 4, 1, 2, metrics=True))[-1]
+        strategies = stats.as_dict()["metrics"]["strategies"]
+        self.assertEqual(list(strategies), ["pick_sequence", "play_sequence"])
+        self.assertEqual(strategies["pick_sequence"]["calls"], 2 * stats.hands)
+
+    def test_unique_names(self):
+        with self.assertRaises(ValueError):
+            next(tournament.tournament([("1", "", ""), ("1", "", "")], 1))
+
+    def test_main(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            tournament.main(["--games", "3", "--processes", "1"])
+        self.assertIn("games\t3", output.getvalue())
+
+
+class TestBench(unittest.TestCase):
+    """Benchmarks time cases and flag regressions"""
+
+    def test_measure(self):
+        result = bench.measure(lambda: None, seconds=0.01)
+        self.assertGreater(result["ops_per_second"], 0)
+        self.assertLessEqual(result["p50_us"], result["p99_us"])
+
+    def test_run(self):
+        results = bench.run(["score", "build_deck"], seconds=0.01)
+        self.assertEqual(list(results["results"]), ["score", "build_deck"])
+
+    def test_compare(self):
+        baseline = {"results": {"a": {"ops_per_second": 100}}}
+        results = {"results": {"a": {"ops_per_second": 85}, "b": {}}}
+        self.assertEqual(bench.compare(results, baseline, 0.2), [])
+        self.assertEqual(bench.compare(results, baseline, 0.1), ["a"])
+
+    def test_baseline(self):
+        """Every case has a committed baseline"""
+        with open(bench.baseline_path) as f:
+            baseline = json.load(f)
+        self.assertCountEqual(baseline["results"], bench.cases())
+
+
+class TestRecords(unittest.TestCase):
+    """Games are recorded to binary files and read back"""
+
+    def setUp(self) -> None:
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "games.crib")
+        return super().setUp()
+
+    def tearDown(self) -> None:
+        self.directory.cleanup()
+        return super().tearDown()
+
+    def play(self, recorder, index, n=2):
+        game = cribbage.Game(
+            name=str(index),
+            n=n,
+            headless=True,
+            rng=cribbage.game_rng(20, index),
+            recorder=recorder,
+        )
+        game.play()
+        return game
+
+    def read(self):
+        with records.Reader(self.path) as reader:
+            return list(reader)
+
+    def test_round_trip(self):
+        with records.Recorder(self.path, seed=20) as recorder:
+            games = [self.play(recorder, i, n) for i, n in enumerate([2, 3, 4])]
+        for game, record in zip(games, self.read()):
+            with self.subTest(n=game.n):
+                self.assertEqual(record.seed, "20")
+                self.assertEqual(record.name, game.name)
+                players = sorted(game.players, key=lambda player: player.name)
+                self.assertEqual(record.players, [p.name for p in players])
+                self.assertEqual(record.scores, [p.score for p in players])
+                self.assertEqual(len(record.hands), game.results["hands"])
+                points = [0] * game.n
+                for hand in record.hands:
+                    for player, reason, awarded in hand.awards:
+                        points[player] += awarded
+                        self.assertIn(reason, range(len(records.reasons)))
+                self.assertEqual(points, record.scores)
+
+    def test_hands(self):
+        with records.Recorder(self.path) as recorder:
+            self.play(recorder, 0)
+        record = self.read()[0]
+        self.assertIsNone(record.seed)
+        for hand in record.hands:
+            self.assertEqual(sorted(hand.seats), [0, 1])
+            dealt = [card for cards in hand.deals for card in cards]
+            self.assertEqual(len(set(dealt + [hand.cut])), 13)
+            self.assertEqual(len(hand.crib), 4)
+            self.assertTrue(set(hand.crib) <= set(dealt))
+            played = [card for player, card in hand.plays if card is not None]
+            for player, card in hand.plays:
+                if card is not None:
+                    self.assertIn(card, hand.deals[hand.seats.index(player)])
+            self.assertTrue(set(played).isdisjoint(hand.crib))
+
+    def test_replay(self):
+        """The seed and name replay the game exactly"""
+        with records.Recorder(self.path, seed=20) as recorder:
+            self.play(recorder, 5)
+            self.play(recorder, 5)
+        first, second = self.read()
+        self.assertEqual(first.scores, second.scores)
+        self.assertEqual(first.hands[-1].plays, second.hands[-1].plays)
+
+    def test_append(self):
+        for i in range(2):
+            with records.Recorder(self.path) as recorder:
+                self.play(recorder, i)
+        self.assertEqual([record.name for record in self.read()], ["0", "1"])
+
+    def test_not_records(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a record file")
+        with self.assertRaises(ValueError):
+            records.Reader(self.path)
+
+    def test_tournament(self):
+        specs = [tournament.parse_player(spec) for spec in ["1", "2"]]
+        folder = os.path.join(self.directory.name, "games")
+        list(tournament.tournament(specs, 5, 1, 2, seed=20, record=folder))
+        names = []
+        for path in sorted(os.listdir(folder)):
+            with records.Reader(os.path.join(folder, path)) as reader:
+                names += [record.name for record in reader]
+        self.assertEqual(names, ["0", "1", "2", "3", "4"])
+
+
+def score_plus_one(hand, cut=None):
+    """A scorer that is wrong on purpose"""
+    return cribbage.score(hand, cut) + 1
+
+
+class TestReplay(unittest.TestCase):
+    """Recorded games score the same when replayed"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        specs = [tournament.parse_player(spec) for spec in ["1", "2", "3"]]
+        list(
+            tournament.tournament(specs, 40, 1, 20, seed=21, record=cls.directory.name)
+        )
+        cls.paths = sorted(
+            os.path.join(cls.directory.name, path)
+            for path in os.listdir(cls.directory.name)
+        )
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def test_same(self):
+        summaries = list(replay.replay(self.paths, processes=1))
+        self.assertEqual([summary["path"] for summary in summaries], self.paths)
+        self.assertEqual(sum(summary["games"] for summary in summaries), 40)
+        for summary in summaries:
+            self.assertEqual(summary["changed_games"], 0)
+            self.assertEqual(summary["diffs"], [])
+
+    def test_reference(self):
+        summaries = replay.replay(
+            self.paths, cribbage.score_direct, cribbage.score_pegs_direct, 1
+        )
+        self.assertEqual(sum(s["changed_hands"] for s in summaries), 0)
+
+    def test_changed(self):
+        summary = replay.replay_file(self.paths[0], score_plus_one, limit=5)
+        self.assertEqual(summary["changed_games"], summary["games"])
+        self.assertEqual(len(summary["diffs"]), 5)
+        diff = summary["diffs"][0]
+        self.assertIn(diff["reason"], records.reasons[2:])
+        self.assertEqual(diff["replayed"], diff["recorded"] + 1)
+
+    def test_processes(self):
+        summaries = list(replay.replay(self.paths, score_plus_one, processes=2))
+        single = list(replay.replay(self.paths, score_plus_one, processes=1))
+        self.assertEqual(summaries, single)
+
+    def test_resolve(self):
+        self.assertIs(replay.resolve("score"), cribbage.score)
+        self.assertIs(replay.resolve("cribbage.score_direct"), cribbage.score_direct)
+
+    def test_main(self):
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            replay.main(self.paths + ["--processes", "1"])
+        self.assertIn("0 of 40 games", output.getvalue())
+
+
+class TestDistribution(unittest.TestCase):
+    """Counting every deal in classes of suit relabelings"""
+
+    def test_classes(self):
+        """The classes of each cut rank cover every deal with that rank cut"""
+        for seq in (1, 5, 11):
+            with self.subTest(seq=seq):
+                weights = sum(weight for _, _, weight in distribution.classes(seq))
+                self.assertEqual(13 * weights, distribution.deals)
+
+    def test_count_cut(self):
+        """Agrees with scoring every hand with a spade cut"""
+        for seq, crib in ((11, False), (5, True)):
+            cut = seq - 1
+            expected = [0] * 30
+            others = [i for i in range(52) if i != cut]
+            for hand in itertools.combinations(others, 4):
+                points = cribbage.score_indices(hand, cut)
+                if crib:
+                    points -= distribution.crib_flush(hand, cut)
+                expected[points] += 4
+            with self.subTest(seq=seq, crib=crib):
+                self.assertEqual(distribution.count_cut(seq, crib), expected)
+
+    def test_canonical(self):
+        """Each class is one canonical key, holding as many deals as its weight"""
+        seq = 11
+        cut = seq - 1
+        expected = {}
+        for hand in itertools.combinations([i for i in range(52) if i != cut], 4):
+            key, _ = cribbage.canonical_indices(hand, cut)
+            expected[key] = expected.get(key, 0) + 4
+        weights = {}
+        for hand, cut, weight in distribution.classes(seq):
+            key, _ = cribbage.canonical_indices(hand, cut)
+            self.assertNotIn(key, weights)
+            weights[key] = weight
+        self.assertEqual(weights, expected)
+
+    def test_hands(self):
+        """The well known counts: four 29s and 1,009,008 hands of nothing"""
+        results = distribution.summary(distribution.distribution(processes=1))
+        self.assertEqual(results["deals"], 12994800)
+        self.assertEqual(results["histogram"][29], 4)
+        self.assertEqual(results["histogram"][0], 1009008)
+        self.assertEqual(
+            [19, 25, 26, 27],
+            [points for points in range(30) if not results["histogram"][points]],
+        )
+        self.assertAlmostEqual(results["mean"], 4.769152, places=6)
+
+
+class TestCribTable(unittest.TestCase):
+    """Expected crib points by discarded pair"""
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.directory = tempfile.TemporaryDirectory()
+        cls.path = os.path.join(cls.directory.name, "crib_table.bin")
+        cls.table = cribbage.build_crib_table(cls.path, samples=3, processes=1)
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.directory.cleanup()
+
+    def test_index(self):
+        """Every pair of discards and role has a place in the table"""
+        indices = set()
+        for first, second in itertools.combinations(range(52), 2):
+            for dealer in (False, True):
+                index = cribbage.crib_table_index([first, second], dealer)
+                self.assertEqual(
+                    index, cribbage.crib_table_index([second, first], dealer)
+                )
+                indices.add(index)
+        self.assertEqual(len(indices), 2 * (13 * 12 + 13))
+        self.assertLess(max(indices), cribbage.crib_table_size)
+
+    def test_load(self):
+        table = cribbage.load_crib_table(self.path)
+        self.assertEqual(list(table), list(self.table))
+        fives = cribbage.crib_table_index([4, 17], True)
+        self.assertGreater(table[fives], 0)
+
+    def test_crib_ev(self):
+        table = cribbage.load_crib_table(self.path)
+        with unittest.mock.patch.object(cribbage, "_crib_table", table):
+            self.assertEqual(
+                cribbage.crib_ev([0, 13], False),
+                table[cribbage.crib_table_index([0, 13], False)],
+            )
+            hand = [cribbage.card_from_string(s) for s in ["5H", "5S", "5D", "JC"]]
+            hand += [cribbage.card_from_string(s) for s in ["KD", "2C"]]
+            kept, crib = cribbage.pick_expected_value(hand, [], 2)
+            self.assertEqual(len(kept), 4)
+
+    def test_missing(self):
+        with unittest.mock.patch.object(cribbage, "_crib_table", False):
+            self.assertIsNone(cribbage.crib_ev([0, 13], True))
+
+
 class TestCribbageScore(unittest.TestCase):
     """Test suite for possible hands"""
 
@@ -205,6 +930,304 @@ class TestCribbageScore(unittest.TestCase):
         self.assertEqual(1, cribbage.score(cards, cut))
 
 
+class TestCardModel(unittest.TestCase):
+    """Cards are shared instances indexed 0-51"""
+
+    def test_interned(self):
+        self.assertIs(
+            cribbage.card_from_string("QH"), cribbage.build_card("Queen", "Heart")
+        )
+        self.assertIs(cribbage.build_deck()[0], cribbage.build_deck()[0])
+
+    def test_index(self):
+        deck = cribbage.build_deck()
+        for i, card in enumerate(deck):
+            with self.subTest(card=card):
+                self.assertEqual(card.index, i)
+                self.assertIs(cribbage.card_from_index(i), card)
+                self.assertEqual(cribbage.card_seqs[i], card.seq)
+                self.assertEqual(cribbage.card_values[i], card.value)
+                self.assertEqual(cribbage.suit_names[cribbage.card_suits[i]], card.suit)
+
+    def test_slots(self):
+        card = cribbage.card_from_string("1D")
+        self.assertFalse(hasattr(card, "__dict__"))
+        self.assertEqual((card.seq, card.value), (10, 10))
+
+    def test_pickle(self):
+        """Unpickled cards are the shared instances"""
+        hand = [cribbage.card_from_string(s) for s in ["AS", "KC"]]
+        self.assertEqual(pickle.loads(pickle.dumps(hand)), hand)
+
+    def test_card_from_string(self):
+        for card in cribbage.all_cards:
+            self.assertIs(cribbage.card_from_string(card.name), card)
+        ten = cribbage.build_card("10", "Diamond")
+        for string in ["1D", "10D", "TD"]:
+            self.assertIs(cribbage.card_from_string(string), ten)
+        for string in ["", "1", "11D", "ZD", "5X", "5h"]:
+            with self.assertRaises(ValueError):
+                cribbage.card_from_string(string)
+
+    def test_parse_hands(self):
+        hands = cribbage.parse_hands("5H 5S JD 5C 5D\n10H JH QH KH AH\n")
+        strings = [cribbage.all_cards[i].name for i in hands]
+        self.assertEqual(strings, "5H 5S JD 5C 5D 1H JH QH KH AH".split())
+        self.assertEqual(cribbage.parse_hands(b"TH JH\nQH KH", width=2), hands[5:9])
+        self.assertEqual(len(cribbage.parse_hands("")), 0)
+        with self.assertRaises(ValueError):
+            cribbage.parse_hands("5H 5S JD 5C")
+        with self.assertRaises(ValueError):
+            cribbage.parse_hands("5H 5S JD 5C 5X")
+
+    def test_canonical(self):
+        """Relabeling suits keeps the key, and the score of the canonical form"""
+        rng = random.Random(7)
+        for _ in range(100):
+            *hand, cut = rng.sample(range(52), 5)
+            key, permutation = cribbage.canonical_indices(hand, cut)
+            canonical_hand = cribbage.relabel_indices(hand, permutation)
+            [canonical_cut] = cribbage.relabel_indices([cut], permutation)
+            self.assertEqual(cribbage.card_suits[canonical_cut], 0)
+            self.assertEqual(
+                cribbage.score_indices(canonical_hand, canonical_cut),
+                cribbage.score_indices(hand, cut),
+            )
+            for suits in itertools.permutations(range(4)):
+                with self.subTest(hand=hand, cut=cut, suits=suits):
+                    relabeled = cribbage.relabel_indices(hand + [cut], suits)
+                    self.assertEqual(
+                        cribbage.canonical_indices(relabeled[:4], relabeled[4])[0],
+                        key,
+                    )
+
+    def test_canonical_cards(self):
+        cards = [cribbage.card_from_string(s) for s in ["5H", "5S", "JD", "5C"]]
+        cut = cribbage.card_from_string("5D")
+        key, permutation = cribbage.canonical(cards, cut)
+        self.assertEqual(permutation[cribbage.suit_names.index("Diamond")], 0)
+        self.assertEqual(key & 15, 5)
+        self.assertNotEqual(key, cribbage.canonical(cards)[0])
+        # his nobs and a flush set hands apart that only differ in suits
+        hearts = [cribbage.card_from_string(s) for s in ["5H", "6H", "JH", "8H"]]
+        mixed = [cribbage.card_from_string(s) for s in ["5H", "6H", "JH", "8S"]]
+        self.assertNotEqual(
+            cribbage.canonical(hearts, cut)[0], cribbage.canonical(mixed, cut)[0]
+        )
+        self.assertNotEqual(
+            cribbage.canonical(hearts, cribbage.card_from_string("2H"))[0],
+            cribbage.canonical(hearts, cribbage.card_from_string("2S"))[0],
+        )
+
+    def test_score_indices(self):
+        rng = random.Random(5)
+        deck = cribbage.build_deck()
+        for i in range(200):
+            rng.shuffle(deck)
+            hand, cut = deck[:4], deck[4]
+            with self.subTest(hand=hand, cut=cut):
+                self.assertEqual(
+                    cribbage.score_indices([card.index for card in hand], cut.index),
+                    cribbage.score_direct(hand, cut),
+                )
+
+
+class TestScoreBatch(unittest.TestCase):
+    """Scoring many hands at once matches score"""
+
+    def setUp(self) -> None:
+        rng = random.Random(6)
+        deck = list(range(52))
+        self.hands = []
+        self.cuts = []
+        for i in range(2000):
+            rng.shuffle(deck)
+            self.hands.append(deck[:4])
+            self.cuts.append(deck[4])
+        # 29, a flush with the cut and a hand with nobs
+        self.hands += [[4, 17, 49, 30], [0, 1, 2, 12], [36, 22, 13, 14]]
+        self.cuts += [43, 6, 29]
+        self.expected = [
+            cribbage.score_direct(
+                [cribbage.card_from_index(i) for i in hand],
+                cribbage.card_from_index(cut),
+            )
+            for hand, cut in zip(self.hands, self.cuts)
+        ]
+        return super().setUp()
+
+    @unittest.skipUnless(importlib.util.find_spec("numpy"), "needs NumPy")
+    def test_numpy(self):
+        import numpy
+
+        points = cribbage.score_batch(
+            numpy.array(self.hands), numpy.array(self.cuts), block_size=500
+        )
+        self.assertEqual(points.shape, (len(self.cuts),))
+        self.assertEqual(points.tolist(), self.expected)
+
+    def test_without_numpy(self):
+        with unittest.mock.patch.dict(sys.modules, {"numpy": None}):
+            points = cribbage.score_batch(self.hands, self.cuts)
+        self.assertEqual(list(points), self.expected)
+
+    def lines(self) -> bytes:
+        text = ""
+        for hand, cut in zip(self.hands, self.cuts):
+            text += " ".join(cribbage.all_cards[i].name for i in hand + [cut]) + "\n"
+        return text.encode()
+
+    def test_score_text(self):
+        expected = "".join(f"{p}\n" for p in self.expected).encode()
+        self.assertEqual(cribbage.score_text(self.lines()), expected)
+        with unittest.mock.patch.dict(sys.modules, {"numpy": None}):
+            self.assertEqual(cribbage.score_text(self.lines()), expected)
+
+    def test_read_lines(self):
+        data = b"5H 5S JD 5C 5D\nAS 2S 3S 4S 5S\n\n1D 1H 1C 1S KD"
+        for size in (1, 7, 15, 100):
+            with self.subTest(size=size):
+                chunks = list(cribbage.read_lines(io.BytesIO(data), size))
+                self.assertEqual(b"".join(chunks), data)
+                for chunk in chunks[:-1]:
+                    self.assertTrue(chunk.endswith(b"\n"))
+
+    def test_bad_lines(self):
+        """A short, long or blank line is an error, not a shift of later hands"""
+        good = b"5H 5S JD 5C 5D\n"
+        for line in (b"5H 5S JD 5C\n", b"5H 5S JD 5C 5D AS\n", b"\n"):
+            data = good * 3 + line + good
+            for processes in (1, 2):
+                with self.subTest(line=line, processes=processes):
+                    with self.assertRaisesRegex(ValueError, "^line 4: "):
+                        cribbage.score_stream(
+                            io.BytesIO(data), io.BytesIO(), processes, chunk_size=20
+                        )
+
+    def test_score_stream(self):
+        """Scores come back in input order, with one process or a pool"""
+        expected = "".join(f"{p}\n" for p in self.expected).encode()
+        for processes in (1, 2):
+            with self.subTest(processes=processes):
+                sink = io.BytesIO()
+                source = io.BytesIO(self.lines())
+                cribbage.score_stream(source, sink, processes, chunk_size=1000)
+                self.assertEqual(sink.getvalue(), expected)
+
+    def test_score_command(self):
+        with tempfile.TemporaryDirectory() as directory:
+            source = os.path.join(directory, "hands.txt")
+            sink = os.path.join(directory, "scores.txt")
+            with open(source, "wb") as f:
+                f.write(self.lines())
+            cribbage.main(["score", source, "--output", sink, "--processes", "1"])
+            with open(sink) as f:
+                self.assertEqual([int(line) for line in f], self.expected)
+
+
+class TestScoreFifteen(unittest.TestCase):
+    """Counting fifteens"""
+
+    def test_matches_subsets(self):
+        """Agrees with checking every subset, for hands of 0-7 cards"""
+        rng = random.Random(4)
+        deck = cribbage.build_deck()
+        for n in range(8):
+            for i in range(50):
+                rng.shuffle(deck)
+                cards = deck[:n]
+                expected = 0
+                for size in range(n + 1):
+                    for subset in itertools.combinations(cards, size):
+                        if cribbage.add_cards(subset) == 15:
+                            expected += 2
+                with self.subTest(cards=cards):
+                    self.assertEqual(cribbage.score_fifteen(cards), expected)
+
+    def test_many_fifteens(self):
+        cards = [cribbage.card_from_string(s) for s in ["5H", "5S", "JD", "5C", "5D"]]
+        self.assertEqual(cribbage.score_fifteen(cards), 16)
+
+
+class TestScoreRuns(unittest.TestCase):
+    """Histogram run counting"""
+
+    def test_matches_permutations(self):
+        """Agrees with score_seq when no rank repeats"""
+        rng = random.Random(3)
+        deck = cribbage.build_deck()
+        for i in range(300):
+            rng.shuffle(deck)
+            cards = []
+            for card in deck:
+                if card.seq not in [c.seq for c in cards]:
+                    cards.append(card)
+                if len(cards) == 5:
+                    break
+            with self.subTest(cards=cards):
+                self.assertEqual(cribbage.score_runs(cards), cribbage.score_seq(cards))
+
+    def test_multiple_runs(self):
+        """Runs count once for each combination of repeated ranks"""
+        examples = [
+            (["AH", "2D", "3H"], 3),
+            (["AH", "AD", "2H", "3C"], 6),
+            (["AH", "AD", "2H", "2C", "3S"], 12),
+            (["AH", "AD", "AC", "2H", "3S"], 9),
+            (["AH", "AD", "2H", "3C", "4S"], 8),
+            (["AH", "2D", "4H", "5C", "6S"], 3),
+            (["9H", "1D", "JH", "QC", "KS"], 5),
+        ]
+        for hand, points in examples:
+            with self.subTest(hand=hand):
+                cards = [cribbage.card_from_string(s) for s in hand]
+                self.assertEqual(cribbage.score_runs(cards), points)
+
+
+class TestScoreTable(unittest.TestCase):
+    """Table scoring matches the reference scoring"""
+
+    def test_random_hands(self):
+        rng = random.Random(1)
+        deck = cribbage.build_deck()
+        for i in range(500):
+            rng.shuffle(deck)
+            hand, cut = deck[:4], deck[4]
+            with self.subTest(hand=hand, cut=cut):
+                self.assertEqual(
+                    cribbage.score(hand, cut), cribbage.score_direct(hand, cut)
+                )
+
+    def test_partial_hands(self):
+        """Hands smaller than four cards, with and without a cut"""
+        rng = random.Random(2)
+        deck = cribbage.build_deck()
+        for n in range(6):
+            rng.shuffle(deck)
+            hand = deck[:n]
+            with self.subTest(hand=hand):
+                self.assertEqual(cribbage.score(hand), cribbage.score_direct(hand))
+                if n < 5:
+                    self.assertEqual(
+                        cribbage.score(hand, deck[5]),
+                        cribbage.score_direct(hand, deck[5]),
+                    )
+
+    def test_reference(self):
+        hand = [cribbage.card_from_string(s) for s in ["5H", "5S", "JD", "5C"]]
+        cut = cribbage.card_from_string("5D")
+        self.assertEqual(cribbage.score(hand, cut), 29)
+        self.assertEqual(cribbage.score(hand, cut, reference=True), 29)
+
+    def test_round_trip(self):
+        """Table survives being written to and read from disk"""
+        table = cribbage.score_table()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "score_table.bin")
+            cribbage.write_score_table(table, path)
+            self.assertEqual(cribbage.read_score_table(path), table)
+
+
 class TestCribbagePegs(unittest.TestCase):
     def test_fifteen_2(self):
         """Two cards fifteen returns 2"""
@@ -292,6 +1315,115 @@ class TestCribbagePegs(unittest.TestCase):
                 self.assertEqual(stacks_strings[i][1], cribbage.score_pegs(hand))
 
 
+class TestPegState(unittest.TestCase):
+    """Incremental pegging matches score_pegs"""
+
+    def stacks(self, n=500):
+        """Random stacks played up to 31"""
+        rng = random.Random(8)
+        deck = cribbage.build_deck()
+        for i in range(n):
+            rng.shuffle(deck)
+            stack = []
+            for card in deck:
+                if sum(c.value for c in stack) + card.value <= 31:
+                    stack.append(card)
+            yield stack
+
+    def test_matches_score_pegs(self):
+        for stack in self.stacks():
+            state = cribbage.PegState()
+            for i, card in enumerate(stack):
+                with self.subTest(stack=stack[: i + 1]):
+                    expected = cribbage.score_pegs_direct(list(stack[: i + 1]))
+                    self.assertEqual(state.peek(card), expected)
+                    self.assertEqual(state.play(card), expected)
+            self.assertEqual(state.stack, stack)
+            self.assertEqual(state.total, sum(card.value for card in stack))
+
+    def test_runs_and_pairs(self):
+        examples = [
+            (["6S", "8H", "7D", "9C"], [0, 0, 3, 4]),
+            (["7S", "7H", "7D", "7C"], [0, 2, 6, 12]),
+            (["AS", "2H", "3D", "3C", "2D"], [0, 0, 3, 2, 0]),
+            (["5S", "1H"], [0, 2]),
+        ]
+        for stack_strings, points in examples:
+            with self.subTest(stack=stack_strings):
+                state = cribbage.PegState()
+                stack = [cribbage.card_from_string(s) for s in stack_strings]
+                self.assertEqual([state.play(card) for card in stack], points)
+
+    def test_resume(self):
+        """A state built from a stack carries on from it"""
+        stack = [cribbage.card_from_string(s) for s in ["4S", "6H"]]
+        state = cribbage.PegState(stack)
+        self.assertEqual(state.total, 10)
+        self.assertEqual(state.play(cribbage.card_from_string("5D")), 5)
+        self.assertEqual(len(stack), 3)
+
+
+class TestPegTable(unittest.TestCase):
+    """Table pegging matches the reference"""
+
+    def test_matches_direct(self):
+        for stack in TestPegState.stacks(self, 300):
+            for i in range(len(stack)):
+                pack = stack[: i + 1]
+                with self.subTest(stack=pack):
+                    self.assertEqual(
+                        cribbage.score_pegs(list(pack)),
+                        cribbage.score_pegs_direct(list(pack)),
+                    )
+
+    def test_long_runs(self):
+        stack = [cribbage.card_from_string(s) for s in ["5S", "3H", "AD", "2C"]]
+        stack += [cribbage.card_from_string(s) for s in ["4D", "7C", "6H"]]
+        self.assertEqual(cribbage.score_pegs(stack), 7)
+        self.assertEqual(cribbage.score_pegs(stack[:-1]), 0)
+
+    def test_over_31(self):
+        """Stacks over 31 are still scored"""
+        stack = [cribbage.card_from_string(s) for s in ["KS", "KH", "KD", "KC"]]
+        self.assertEqual(cribbage.score_pegs(stack), 12)
+
+    def test_round_trip(self):
+        table = cribbage.peg_table()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "peg_table.bin")
+            cribbage.write_peg_table(*table, path)
+            points, next_states = cribbage.load_peg_table(path)
+            self.assertEqual(list(points), list(table[0]))
+            self.assertEqual(list(next_states), list(table[1]))
+            del points, next_states
+
+    def test_rewrite_while_mapped(self):
+        """Writing the table again leaves a mapped copy whole"""
+        table = cribbage.peg_table()
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "peg_table.bin")
+            cribbage.write_peg_table(*table, path)
+            points, next_states = cribbage.load_peg_table(path)
+            cribbage.write_peg_table(points, next_states, path)
+            self.assertEqual(list(points), list(table[0]))
+            self.assertEqual(os.listdir(directory), ["peg_table.bin"])
+            with self.assertRaises(TypeError):
+                cribbage.write_peg_table(points, None, path)
+            self.assertEqual(os.listdir(directory), ["peg_table.bin"])
+            del points, next_states
+
+    def test_file_mode(self):
+        """Tables are written with the permissions open() would give"""
+        umask = os.umask(0o022)
+        try:
+            with tempfile.TemporaryDirectory() as directory:
+                path = os.path.join(directory, "peg_table.bin")
+                cribbage.write_peg_table(*cribbage.peg_table(), path)
+                self.assertEqual(os.stat(path).st_mode & 0o777, 0o644)
+        finally:
+            os.umask(umask)
+
+
 class TestCribbagePlayer(unittest.TestCase):
     """Test suite for Player class"""
 
@@ -312,6 +1444,7 @@ class TestCribbagePlayer(unittest.TestCase):
             "strategy_pegs": "function",
             "count_hand": list,
             "logging_level": int,
+            "dealer": bool,
         }
         for key in attributes:
             val = getattr(player, key)
@@ -349,6 +1482,16 @@ class TestCribbagePlayer(unittest.TestCase):
         player.see(seen[0])  # also tests that seen is instantiated blank
         self.assertEqual(player.seen, seen)
 
+    def test_seen_mask(self):
+        deck = cribbage.build_deck()
+        hand = cribbage.draw_hand(deck, 2)
+        player = cribbage.Player(hand=hand)
+        player.hand = hand
+        expected = (1 << hand[0].index) | (1 << hand[1].index)
+        self.assertEqual(player.seen_mask, expected)
+        player.reshuffle()
+        self.assertEqual(player.seen_mask, expected)
+
     def test_reshuffle(self):
         deck = cribbage.build_deck()
         seen = cribbage.draw_hand(deck, 1)
@@ -533,6 +1676,23 @@ class TestCribbageHand(unittest.TestCase):
         self.hand.award(player, 1, "testing")
         self.assertEqual(self.hand.players[0].score, 1)
 
+    def test_award_lazy(self):
+        """Award messages are not built when they won't be logged"""
+        player = self.hand.players[0]
+        with unittest.mock.patch.object(
+            cribbage.Hand, "as_dict", side_effect=AssertionError
+        ):
+            self.hand.award(player, 1, "testing {stack}")
+        self.assertEqual(player.score, 1)
+
+    def test_award_log(self):
+        """Award messages keep their format when logged"""
+        player = self.hand.players[0]
+        with self.assertLogs(logger.awarder, logger.default_level) as logs:
+            self.hand.award(player, 2, "Crib: {crib}", crib=["AH"])
+        self.assertEqual(logs.records[0].getMessage(), "Player 1 | 2 | Crib: ['AH']")
+        self.assertEqual(logs.records[0].stack_total, 0)
+
     def test_award_win(self):
         """Default win score raises win exception"""
         player = self.hand.players[0]
@@ -791,6 +1951,76 @@ class TestCribbageGame(unittest.TestCase):
         self.assertIsInstance(self.game.results, dict)
         self.assertIsNotNone(self.game.results)
 
+    def test_headless(self):
+        """Headless games end the same way as logged games"""
+        outcomes = []
+        for headless in (False, True):
+            random.seed(7)
+            game = cribbage.Game(n=2, headless=headless)
+            game.play()
+            players = game.results["players"]
+            outcomes.append(
+                (game.results["hands"], [(p.name, p.score) for p in players])
+            )
+        self.assertEqual(outcomes[0], outcomes[1])
+
+    def test_rng(self):
+        """Games with their own stream replay exactly and leave random alone"""
+        state = random.getstate()
+        outcomes = []
+        for _ in range(2):
+            game = cribbage.Game(n=2, headless=True, rng=cribbage.game_rng(1, 17))
+            game.play()
+            players = game.results["players"]
+            outcomes.append([(p.name, p.score) for p in players])
+        self.assertEqual(outcomes[0], outcomes[1])
+        self.assertEqual(random.getstate(), state)
+
+    def test_metrics(self):
+        """Metrics time every phase and strategy, across games"""
+        metrics = cribbage.Metrics()
+        hands = 0
+        for seed in range(2):
+            game = cribbage.Game(
+                n=2, headless=True, rng=cribbage.game_rng(seed, 19), metrics=metrics
+            )
+            game.play()
+            self.assertIs(game.results["metrics"], metrics)
+            hands += game.results["hands"]
+        results = metrics.as_dict()
+        phases = results["phases"]
+        self.assertEqual(list(phases), ["deal", "collect", "cut", "tricks", "count"])
+        self.assertEqual(phases["deal"]["calls"], hands)
+        self.assertEqual(results["strategies"]["pick_sequence"]["calls"], 2 * hands)
+        self.assertGreater(results["strategies"]["play_sequence"]["seconds"], 0)
+
+    def test_no_metrics(self):
+        game = cribbage.Game(n=2, headless=True)
+        game.play()
+        self.assertNotIn("metrics", game.results)
+
+    def test_metrics_merge(self):
+        metrics, other = cribbage.Metrics(), cribbage.Metrics()
+        metrics.add(metrics.phases, "deal", 10)
+        other.add(other.phases, "deal", 20)
+        other.add(other.strategies, "play_sequence", 5)
+        metrics.merge(other)
+        self.assertEqual(metrics.phases, {"deal": [2, 30]})
+        self.assertEqual(metrics.strategies, {"play_sequence": [1, 5]})
+
+    def test_game_rng(self):
+        self.assertEqual(
+            cribbage.game_rng(1, 2).random(), cribbage.game_rng(1, 2).random()
+        )
+        self.assertNotEqual(
+            cribbage.game_rng(1, 2).random(), cribbage.game_rng(1, 3).random()
+        )
+
+    def test_headless_no_logs(self):
+        with unittest.mock.patch.object(logger.awarder, "log") as log:
+            cribbage.Game(n=2, headless=True).play()
+        log.assert_not_called()
+
 
 if __name__ == "__main__":
     unittest.main()
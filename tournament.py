@@ -0,0 +1,305 @@
+"""
+Play many games between strategies across a pool of processes
+"""
+
+import argparse
+import concurrent.futures
+import json
+import os
+import typing
+
+import cribbage
+import logger
+import records
+import search
+
+skunk_line = 30  # losers under win - 30 are skunked, under win - 60 double
+
+
+def resolve(name: str):
+    """Find a strategy by name in cribbage or search, or as module.attribute"""
+    strategy = cribbage.resolve(name, [search])
+    if hasattr(strategy, "is_human"):
+        raise ValueError(f"{name} needs a human to play")
+    return strategy
+
+
+def parse_player(spec: str) -> typing.Tuple[str, str, str]:
+    """
+    Split a player spec of name=pick,play into its parts
+    pick and play default to the sequence strategies
+    """
+    name, _, strategies = spec.partition("=")
+    pick, _, play = strategies.partition(",")
+    return name, pick or "pick_sequence", play or "play_sequence"
+
+
+class Stats(object):
+    """Running totals over games between the same players"""
+
+    def __init__(self, names: typing.List[str]) -> None:
+        self.names = list(names)
+        self.games = 0
+        self.hands = 0
+        self.margin = 0
+        self.skunks = 0
+        self.double_skunks = 0
+        self.wins = dict.fromkeys(self.names, 0)
+        self.points = dict.fromkeys(self.names, 0)
+        self.skunked = dict.fromkeys(self.names, 0)
+        self.double_skunked = dict.fromkeys(self.names, 0)
+        self.metrics: cribbage.Metrics = None
+
+    def add(self, players: typing.List[cribbage.Player], hands: int, win=121):
+        """Count a finished game"""
+        ranked = sorted(players, key=lambda player: player.score, reverse=True)
+        self.games += 1
+        self.hands += hands
+        self.wins[ranked[0].name] += 1
+        if len(ranked) > 1:
+            self.margin += ranked[0].score - ranked[1].score
+        for player in ranked:
+            self.points[player.name] += player.score
+            if player is ranked[0]:
+                continue
+            if player.score < win - 2 * skunk_line:
+                self.double_skunks += 1
+                self.double_skunked[player.name] += 1
+            elif player.score < win - skunk_line:
+                self.skunks += 1
+                self.skunked[player.name] += 1
+
+    def merge(self, other: "Stats") -> None:
+        """Add the totals of another Stats for the same players"""
+        self.games += other.games
+        self.hands += other.hands
+        self.margin += other.margin
+        self.skunks += other.skunks
+        self.double_skunks += other.double_skunks
+        for totals, others in (
+            (self.wins, other.wins),
+            (self.points, other.points),
+            (self.skunked, other.skunked),
+            (self.double_skunked, other.double_skunked),
+        ):
+            for name, value in others.items():
+                totals[name] += value
+        if other.metrics is not None:
+            if self.metrics is None:
+                self.metrics = cribbage.Metrics()
+            self.metrics.merge(other.metrics)
+
+    def as_dict(self) -> dict:
+        games = self.games or 1
+        results = {
+            "games": self.games,
+            "hands_per_game": self.hands / games,
+            "average_margin": self.margin / games,
+            "skunks": self.skunks,
+            "double_skunks": self.double_skunks,
+            "players": {
+                name: {
+                    "wins": self.wins[name],
+                    "win_rate": self.wins[name] / games,
+                    "average_score": self.points[name] / games,
+                    "skunked": self.skunked[name],
+                    "double_skunked": self.double_skunked[name],
+                }
+                for name in self.names
+            },
+        }
+        if self.metrics is not None:
+            results["metrics"] = self.metrics.as_dict()
+        return results
+
+
+def play_game(
+    strategies: typing.List[tuple],
+    index: int,
+    win: int = 121,
+    seed=None,
+    metrics: cribbage.Metrics = None,
+    recorder: records.Recorder = None,
+) -> cribbage.Game:
+    """
+    Play game `index` of a tournament between (name, pick, play) strategies
+    With a seed, the game has its own random stream and replays exactly
+    """
+    players = [
+        cribbage.Player(name, strategy_hand=pick, strategy_pegs=play)
+        for name, pick, play in strategies
+    ]
+    shift = index % len(players)
+    players = players[shift:] + players[:shift]
+    rng = None if seed is None else cribbage.game_rng(seed, index)
+    game = cribbage.Game(
+        name=str(index),
+        players=players,
+        win=win,
+        headless=True,
+        rng=rng,
+        metrics=metrics,
+        recorder=recorder,
+    )
+    game.play()
+    return game
+
+
+def play_games(
+    specs: typing.List[typing.Tuple[str, str, str]],
+    start: int,
+    count: int,
+    win: int = 121,
+    seed=None,
+    metrics: bool = False,
+    record: str = None,
+) -> Stats:
+    """
+    Play games `start` to `start + count` headless and return their totals
+    The seat each player starts in rotates from game to game
+    With `metrics`, the totals include time per phase and per strategy
+    With `record`, the games are saved to a file for the chunk in that folder
+    """
+    strategies = [(name, resolve(pick), resolve(play)) for name, pick, play in specs]
+    stats = Stats([name for name, _, _ in specs])
+    if metrics:
+        stats.metrics = cribbage.Metrics()
+    recorder = None
+    if record:
+        path = os.path.join(record, f"{start:012d}.crib")
+        recorder = records.Recorder(path, seed)
+    try:
+        for i in range(start, start + count):
+            game = play_game(strategies, i, win, seed, stats.metrics, recorder)
+            stats.add(game.results["players"], game.results["hands"], win)
+    finally:
+        if recorder is not None:
+            recorder.close()
+    return stats
+
+
+def tournament(
+    specs: typing.List[typing.Tuple[str, str, str]],
+    games: int,
+    processes: int = None,
+    chunk_size: int = 1000,
+    win: int = 121,
+    seed=None,
+    metrics: bool = False,
+    record: str = None,
+) -> typing.Iterator[Stats]:
+    """
+    Play `games` games between players given as (name, pick, play) names
+
+    Games are played in chunks across a pool of `processes`, and the
+    running totals are yielded as each chunk finishes, so only a few
+    chunks are ever held in memory. With one process, play here.
+    With a seed, every game has its own stream, see `play_game`.
+    With `record`, every game is saved in a file per chunk in that folder.
+    """
+    names = [name for name, _, _ in specs]
+    if len(set(names)) != len(names):
+        raise ValueError("Player names must be unique")
+    for _, pick, play in specs:
+        resolve(pick)
+        resolve(play)
+    chunks = [
+        (start, min(chunk_size, games - start)) for start in range(0, games, chunk_size)
+    ]
+    if record:
+        os.makedirs(record, exist_ok=True)
+    totals = Stats(names)
+    if processes == 1:
+        for start, count in chunks:
+            totals.merge(play_games(specs, start, count, win, seed, metrics, record))
+            yield totals
+        return
+
+    window = 2 * (processes or os.cpu_count() or 1)
+    # workers don't write to the log file, which the caller may be using
+    with concurrent.futures.ProcessPoolExecutor(
+        processes, initializer=logger.configure_logging, initargs=(None,)
+    ) as pool:
+        pending = set()
+        for i, (start, count) in enumerate(chunks):
+            pending.add(
+                pool.submit(play_games, specs, start, count, win, seed, metrics, record)
+            )
+            last = i == len(chunks) - 1
+            # keep a few chunks queued per process, and drain at the end
+            while len(pending) >= window or (last and pending):
+                done, pending = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    totals.merge(future.result())
+                    yield totals
+
+
+def main(argv: typing.List[str] = None):
+    parser = argparse.ArgumentParser(description="Play a cribbage tournament")
+    parser.add_argument(
+        "--player",
+        action="append",
+        dest="players",
+        help="name=pick,play with strategies from cribbage or search, "
+        "or module.attribute (default two players of sequence strategies)",
+    )
+    parser.add_argument("--games", type=int, default=1000)
+    parser.add_argument("--processes", type=int)
+    parser.add_argument("--chunk-size", type=int, default=1000)
+    parser.add_argument("--win", type=int, default=121)
+    parser.add_argument("--seed")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="print the running totals as a JSON line after each chunk",
+    )
+    parser.add_argument(
+        "--metrics",
+        action="store_true",
+        help="time each phase of a hand and each strategy",
+    )
+    parser.add_argument(
+        "--record", help="folder to save a record of every game in, see records.py"
+    )
+    args = parser.parse_args(argv)
+
+    specs = [parse_player(spec) for spec in args.players or ["1", "2"]]
+    totals = None
+    for totals in tournament(
+        specs,
+        args.games,
+        args.processes,
+        args.chunk_size,
+        args.win,
+        args.seed,
+        args.metrics,
+        args.record,
+    ):
+        if args.stream:
+            print(json.dumps(totals.as_dict()), flush=True)
+    if totals is None or args.stream:
+        return
+    results = totals.as_dict()
+    print(f"games\t{results['games']}")
+    print(f"hands per game\t{results['hands_per_game']:.2f}")
+    print(f"average margin\t{results['average_margin']:.2f}")
+    print(f"skunks\t{results['skunks']} ({results['double_skunks']} double)")
+    for name, player in results["players"].items():
+        print(
+            f"{name}\t{player['win_rate']:.1%} wins\t"
+            f"{player['average_score']:.1f} points\t"
+            f"{player['skunked']} skunked"
+        )
+    labels = {"phases": "phase", "strategies": "strategy"}
+    for kind, timings in results.get("metrics", {}).items():
+        for name, timing in timings.items():
+            print(
+                f"{labels[kind]} {name}\t{timing['calls']} calls\t"
+                f"{timing['seconds']:.3f} s\t{timing['mean_us']:.1f} us each"
+            )
+
+
+if __name__ == "__main__":
+    main()